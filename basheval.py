@@ -18,38 +18,76 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
 
-# System imports
-import textwrap
-
 class BashEval:
     """
     Class for converting commands, echos, variable definitions etc. to command
     strings for parsing by Bash's `eval` built-in function.
+
+    Optionally, messages can be written directly to a file object (e.g. the
+    terminal) as soon as they are produced, while all other commands are still
+    collected and only returned at the end. Thus, output is streamed, but
+    modifications of the environment are never applied partially.
     """
 
     textwidth = 80
-    replacements = {'$': '\$', '`': '\`', '\n': '\\n', '"': '\\"'}
+    replacements = {'$': '\$', '`': '\`', '\n': '\\n', '"': '\\"', '%': '%%'}
     kinds = ['normal', 'info', 'success', 'error']
 
-    def __init__(self, use_colors=True):
-        """If `use_colors` is False, not colors are used for highlighting."""
+    def __init__(self, use_colors=True, display=None, merge=True):
+        """Save arguments and initialize member variables.
+
+        Arguments:
+          use_colors -- if false, no colors are used for highlighting
+          display    -- file object to which messages are written directly
+                        (default: None, i.e. messages are printed by 'printf'
+                        commands in the command string)
+          merge      -- if true, consecutive messages are printed by a single
+                        'printf' command, which is much faster to eval for
+                        Bash than one command per message
+        """
         self.use_colors = use_colors
+        self.display = display
+        self.merge = merge
         self.cmds = []
+        self.messages = []
+        self.has_errors = False
 
     def clear(self):
-        """Clear list of previously issued commands."""
+        """Clear list of previously issued commands (messages that were
+        already written to the display are not affected)."""
         self.cmds = []
+        self.messages = []
+
+    def flush(self):
+        """Flush messages written to the display."""
+        if self.display is not None:
+            self.display.flush()
 
     def execute(self, cmd):
         """Add `cmd` to list of commands."""
+        if self.messages:
+            self.close_messages()
         self.cmds.append(str(cmd))
 
+    def close_messages(self):
+        """Add command to print all messages collected since the last command
+        (cf. `echo()`)."""
+        message = ''.join(self.messages)
+        self.messages = []
+        self.execute('printf "{m}"'.format(m=self.quote(message)))
+
     def cmdstring(self):
         """Get list of commands joined by ';' to be eval'd."""
-        s = ';'.join(self.cmds)
+        s = self.peek()
         self.clear()
         return s
 
+    def peek(self):
+        """Get list of commands joined by ';' without clearing it."""
+        if self.messages:
+            self.close_messages()
+        return ';'.join(self.cmds)
+
     def highlight(self, message, kind='normal'):
         """Add highlight to given `message`, depending on `kind`.
 
@@ -92,6 +130,7 @@ class BashEval:
 
         # Dedent common indentation
         if dedent:
+            import textwrap
             message = textwrap.dedent(message)
 
         # Store final newline as it will be lost in the later process
@@ -106,10 +145,17 @@ class BashEval:
             else:
                 indent = ''
 
-            # Do the wrapping
-            lines.append(textwrap.fill(line, width=width,
-                                       subsequent_indent=indent,
-                                       drop_whitespace=False))
+            # Do the wrapping (lines that fit and do not contain whitespace
+            # that would be replaced are left as they are, which avoids
+            # importing `textwrap` for most messages)
+            if len(line) <= width and not any(c in line for c in
+                                                '\t\r\x0b\x0c'):
+                lines.append(line)
+            else:
+                import textwrap
+                lines.append(textwrap.fill(line, width=width,
+                                           subsequent_indent=indent,
+                                           drop_whitespace=False))
 
         # Join the lines and add final newline if it was originally present
         return '\n'.join(lines) + ('\n' if final_newline else '')
@@ -120,6 +166,15 @@ class BashEval:
             s = s.replace(pattern, substitute)
         return s
 
+    def render(self, message='', kind='normal', newline=True, dedent=False,
+               width=None):
+        """Return `message` wrapped and highlighted as it is printed by
+        `echo()` (cf. `echo()` for the arguments). The result can be printed
+        with `echo_rendered()`, e.g. after caching it."""
+        return self.highlight(self.wrap(str(message), width=width,
+                                        dedent=dedent),
+                              kind=kind) + ('\n' if newline else '')
+
     def echo(self, message='', kind='normal', newline=True, dedent=False,
              width=None):
         """Generate command to print `message` using 'printf'.
@@ -131,13 +186,25 @@ class BashEval:
           dedent  -- if true, remove common indent from all lines (cf. `wrap()`)
           width   -- maximum line width information to pass to `wrap()`
         """
-        # Add newline only if option is set
-        nl = r'\n' if newline else ''
-
-        # Add printf command to command queue
-        self.execute('printf "{m}{n}"'.format(m=self.highlight(
-                self.quote(self.wrap(str(message), width=width, dedent=dedent)),
-                kind=kind), n=nl))
+        self.echo_rendered(self.render(message, kind=kind, newline=newline,
+                                       dedent=dedent, width=width))
+
+    def echo_rendered(self, text):
+        """Generate command to print `text` that was returned by `render()`."""
+        # Write text directly to the display if set (only the escape
+        # sequences for highlighting need to be converted, since no quoting
+        # is necessary)
+        if self.display is not None:
+            self.display.write(text.replace(r'\033[', '\033['))
+        # Otherwise collect text to print it together with all following
+        # messages (escape sequences for highlighting do not contain any
+        # characters that need to be quoted, thus the whole text is quoted at
+        # once)
+        elif self.merge:
+            self.messages.append(text)
+        # Otherwise add printf command to command queue
+        else:
+            self.execute('printf "{m}"'.format(m=self.quote(text)))
 
     def error(self, message, newline=True, internal=False):
         """Generate command to print error message.
@@ -147,6 +214,9 @@ class BashEval:
           newline  -- if true, add newline to message
           internal -- if true, apply additional formatting for internal errors
         """
+        # Remember that an error occurred
+        self.has_errors = True
+
         # Set prefix depending on whether this is an internal error
         prefix = "modm: Error: " if not internal else "modm: Internal error: "
 
@@ -159,7 +229,8 @@ class BashEval:
 
     def export(self, key, value):
         """Set environment variable `key` to `value` and export it."""
-        self.execute("export {k}='{v}'".format(k=key, v=value))
+        self.execute("export {k}='{v}'".format(
+                k=key, v=value.replace("'", "'\\''")))
 
     def unset(self, key):
         """Unset environment variable `key`."""
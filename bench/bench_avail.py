@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+# Modm - Modules iMproved
+# Copyright (C) 2013-2014  Michael Schlottke
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+
+# Benchmark for rendering the output of 'avail' (`Modm.print_modules`):
+# compares the current renderer with the previous implementation, which
+# filtered the module list once per category and checked for loaded modules
+# in a list, and verifies that both produce identical output. Usage:
+# bench_avail.py [modules] [repetitions]
+
+# System imports
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+# Project imports
+from synthtree import make_tree
+from modm import Modm
+
+def legacy_natsorted(l, key=lambda x: x):
+    """Previous implementation of `natsort.natsorted()`."""
+    convert = lambda s: int(s) if s.isdigit() else s
+    alphanum_key = lambda k: [convert(c) for c in
+            re.split('([0-9]+)', key(k))]
+    return sorted(l, key=alphanum_key)
+
+def legacy_print_modules(self, modules):
+    """Previous implementation of `Modm.print_modules()`."""
+    maxlength = 0
+    categories = set()
+    for module in modules:
+        maxlength = max(maxlength, len(module.name))
+        categories.add(module.category.strip().upper()
+                       if module.category else None)
+
+    if None in categories:
+        categories = legacy_natsorted([c for c in categories if c is not None])
+        categories.append(None)
+    else:
+        categories = legacy_natsorted(list(categories))
+
+    first = True
+    for category in categories:
+        if first:
+            first = False
+        else:
+            self.be.echo('')
+        self.be.echo(category if category else '<UNCATEGORIZED>')
+        for module in [m for m in modules if (
+                (True if category is None else False) if (
+                    m.category is None) else (
+                m.category.strip().upper() == category))]:
+            versions = []
+            for version in module.versions:
+                v = os.path.basename(version)
+                if version == module.default:
+                    v = v + '(default)'
+                if version in self.env.modloaded:
+                    v = self.be.highlight(v + '*', kind='info')
+                versions.append(v)
+            self.be.echo('  {m:{l}} {v}'.format(m=module.name+':',
+                         l=maxlength+1, v=', '.join(versions)))
+
+def measure(function, m, repeat):
+    """Return output and minimum time of rendering all modules of `m`."""
+    best = None
+    for _ in range(repeat):
+        m.be.clear()
+        start = time.time()
+        function(m, m.modules)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return m.be.cmdstring(), best
+
+def main():
+    modules = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    root = tempfile.mkdtemp(prefix='modm-bench-')
+    try:
+        directories = make_tree(root, modules=modules, versions=3, paths=2,
+                                categories=50, lines=1)
+
+        # Mark some modules as loaded
+        loaded = [os.path.join(directories[0], 'mod{m}'.format(m=m), '0.1')
+                  for m in range(0, modules, max(1, modules // 100))]
+        environ = dict(os.environ)
+        environ[Modm.modules_path_var] = os.pathsep.join(directories)
+        environ[Modm.modules_loaded_var] = os.pathsep.join(loaded)
+        environ[Modm.cache_setting_var] = 'off'
+
+        # Discover modules with the current implementation
+        m = Modm(environ=environ)
+        start = time.time()
+        m.init_modules()
+        print('discovery: {0:.3f} s'.format(time.time() - start))
+
+        # Make sure that modules are sorted as before
+        if [x.name for x in m.modules] != [x.name for x in legacy_natsorted(
+                m.modules, key=lambda x: x.name)]:
+            print('ERROR: module order differs')
+            sys.exit(1)
+
+        # Render output
+        old, told = measure(legacy_print_modules, m, repeat)
+        new, tnew = measure(Modm.print_modules, m, repeat)
+        print('legacy:    {0:.3f} s'.format(told))
+        print('current:   {0:.3f} s'.format(tnew))
+        if old != new:
+            print('ERROR: output differs')
+            sys.exit(1)
+        print('output identical ({0} bytes)'.format(len(new)))
+    finally:
+        shutil.rmtree(root)
+
+if __name__ == '__main__':
+    main()
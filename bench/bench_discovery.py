@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+# Modm - Modules iMproved
+# Copyright (C) 2013-2014  Michael Schlottke
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+# Benchmark for module discovery (`Modm.init_modules`): measures the time to
+# build the module registry for growing numbers of module versions. If
+# discovery scales linearly, the time per version stays constant.
+#
+# Afterwards, it checks that loading a single module with a warm module index
+# stays as fast as without the index, i.e. that the targeted discovery of
+# 'load' only reads the index entries of the requested module. Both take well
+# below a millisecond, so timings within `tolerance` count as equal.
+
+# System imports
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Project imports
+from synthtree import make_tree
+from modm import Modm
+
+class Buffer:
+    """
+    Class to discard the output of Modm.
+    """
+
+    def write(self, text):
+        pass
+
+# Relative slowdown of the indexed load that is still attributed to noise
+tolerance = 0.25
+
+def run(argv, environ, repeat=20):
+    """Return the minimum time of running Modm `repeat` times."""
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        Modm(['modm.py'] + argv, environ=environ).run(Buffer())
+        times.append(time.time() - start)
+    return min(times)
+
+def check_targeted(modules=10000, versions=5):
+    """Compare loading a single module with a warm module index and without
+    the index in a tree with `modules` modules. Return True if the index
+    does not make loading slower."""
+    root = tempfile.mkdtemp(prefix='modm-bench-')
+    try:
+        directories = make_tree(root, modules=modules, versions=versions,
+                                lines=1)
+        environ = dict(os.environ)
+        environ[Modm.modules_path_var] = os.pathsep.join(directories)
+        environ[Modm.cache_dir_var] = os.path.join(root, 'cache')
+        environ[Modm.eval_cache_setting_var] = 'off'
+        environ.pop(Modm.cache_setting_var, None)
+
+        # Build the index for the whole tree first
+        run(['avail'], environ, repeat=1)
+        argv = ['load', 'mod{0}'.format(modules // 2)]
+        cached = run(argv, environ)
+        environ[Modm.cache_setting_var] = 'off'
+        uncached = run(argv, environ)
+    finally:
+        shutil.rmtree(root)
+
+    print('')
+    print("'{c}' in a tree with {m} modules: {w:.2f} ms with warm index, "
+          "{u:.2f} ms without index".format(c=' '.join(argv), m=modules,
+          w=cached * 1e3, u=uncached * 1e3))
+    return cached <= uncached * (1 + tolerance)
+
+def main():
+    # Module/version combinations (total number of versions up to 50k)
+    sizes = [(1000, 1), (1000, 5), (5000, 2), (5000, 5), (10000, 5)]
+
+    print('{0:>8} {1:>9} {2:>10} {3:>12}'.format(
+        'modules', 'versions', 'time [s]', 'us/version'))
+    for modules, versions in sizes:
+        root = tempfile.mkdtemp(prefix='modm-bench-')
+        try:
+            directories = make_tree(root, modules=modules, versions=versions,
+                                    lines=1)
+            os.environ[Modm.modules_path_var] = os.pathsep.join(directories)
+            os.environ[Modm.cache_setting_var] = 'off'
+
+            # Measure discovery without the persistent index cache
+            m = Modm()
+            start = time.time()
+            m.init_modules()
+            elapsed = time.time() - start
+
+            total = modules * versions
+            print('{0:>8} {1:>9} {2:>10.3f} {3:>12.2f}'.format(
+                modules, total, elapsed, elapsed / total * 1e6))
+        finally:
+            shutil.rmtree(root)
+
+    # Targeted discovery must not depend on the size of the index
+    if not check_targeted():
+        print('FAILED: loading with the index is slower than without it')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
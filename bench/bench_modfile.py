@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+# Modm - Modules iMproved
+# Copyright (C) 2013-2014  Michael Schlottke
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+# Benchmark for loading and unloading module files with `ModfileParser`:
+# compares a cold cache (module files are tokenized) with a warm cache
+# (compiled module files are read from the persistent cache). Each repetition
+# uses a new parser, just like separate calls to Modm do.
+
+# System imports
+import os
+import shutil
+import tempfile
+import time
+
+# Project imports
+from synthtree import make_tree
+from basheval import BashEval
+from cache import Cache
+from env import Env
+from modfileparser import ModfileParser
+
+def measure(modfiles, cachedir, repeat, cold):
+    """Return average time to load and unload all `modfiles` once."""
+    total = 0.0
+    for _ in range(repeat):
+        if cold and os.path.isdir(cachedir):
+            shutil.rmtree(cachedir)
+        parser = ModfileParser(Env(), BashEval(), cache=Cache(cachedir))
+        start = time.time()
+        for modfile in modfiles:
+            parser.load(modfile)
+        for modfile in modfiles:
+            parser.unload(modfile)
+        total += time.time() - start
+    return total / repeat
+
+def main():
+    repeat = 5
+    print('{0:>8} {1:>8} {2:>10} {3:>10} {4:>8}'.format(
+        'modules', 'lines', 'cold [s]', 'warm [s]', 'speedup'))
+    for modules, lines in [(10, 100), (10, 300), (5, 1000)]:
+        root = tempfile.mkdtemp(prefix='modm-bench-')
+        try:
+            directory = make_tree(root, modules=modules, lines=lines)[0]
+            modfiles = [os.path.join(directory, 'mod{m}'.format(m=m), '0.0')
+                        for m in range(modules)]
+            cachedir = os.path.join(root, 'cache')
+
+            cold = measure(modfiles, cachedir, repeat, cold=True)
+            warm = measure(modfiles, cachedir, repeat, cold=False)
+            print('{0:>8} {1:>8} {2:>10.4f} {3:>10.4f} {4:>7.1f}x'.format(
+                modules, lines, cold, warm, cold / warm))
+        finally:
+            shutil.rmtree(root)
+
+if __name__ == '__main__':
+    main()
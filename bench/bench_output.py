@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+# Modm - Modules iMproved
+# Copyright (C) 2013-2014  Michael Schlottke
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+
+# Benchmark for the cost of the output of Modm: for 'avail' and 'config',
+# measures the time Python needs to generate the command string and the time
+# Bash needs to eval it, both with one 'printf' command per message and with
+# consecutive messages merged into a single 'printf' command. Usage:
+# bench_output.py [modules] [repetitions]
+
+# System imports
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# Project imports
+from synthtree import make_tree
+from modm import Modm
+
+def generate(argv, environ, merge):
+    """Return command string of Modm for `argv` and the time to generate
+    it."""
+    m = Modm(['modm.py'] + argv, environ=environ)
+    m.be.merge = merge
+    start = time.time()
+    m.rununsafe()
+    output = m.be.cmdstring()
+    return output, time.time() - start
+
+def bash_eval(path, repeat):
+    """Return the time Bash needs to eval the command string in file `path`
+    `repeat` times minus the time to only read it."""
+    def measure(script):
+        with open(os.devnull, 'w') as devnull:
+            start = time.time()
+            subprocess.check_call(['bash', '-c', script, 'bench', path],
+                                  stdout=devnull)
+            return time.time() - start
+    read = 'for i in $(seq {r}); do s="$(cat "$1")"; done'.format(r=repeat)
+    run = 'for i in $(seq {r}); do s="$(cat "$1")"; eval "$s"; done'.format(
+            r=repeat)
+    return (measure(run) - measure(read)) / repeat
+
+def main():
+    modules = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    root = tempfile.mkdtemp(prefix='modm-bench-')
+    try:
+        directories = make_tree(root, modules=modules, versions=3,
+                                categories=20, lines=1)
+        environ = dict(os.environ)
+        environ[Modm.modules_path_var] = os.pathsep.join(directories)
+        environ[Modm.cache_dir_var] = os.path.join(root, 'cache')
+        environ[Modm.color_setting_var] = 'on'
+        environ['MODM_PY'] = 'modm.py'
+        environ.pop(Modm.display_fd_var, None)
+        path = os.path.join(root, 'output')
+
+        print('{0:<8} {1:<9} {2:>10} {3:>12} {4:>12}'.format(
+            'command', 'printf', 'commands', 'python [ms]', 'bash [ms]'))
+        for argv in [['avail'], ['config']]:
+            outputs = []
+            for merge in [False, True]:
+                generate(argv, environ, merge)
+                output, elapsed = min([generate(argv, environ, merge)
+                                       for _ in range(repeat)],
+                                      key=lambda r: r[1])
+                with open(path, 'w') as f:
+                    f.write(output)
+                print('{0:<8} {1:<9} {2:>10} {3:>12.1f} {4:>12.1f}'.format(
+                    argv[0], 'merged' if merge else 'separate',
+                    output.count('printf '), elapsed * 1000,
+                    bash_eval(path, repeat) * 1000))
+                outputs.append(subprocess.check_output(
+                        ['bash', '-c', 'eval "$(cat "$1")"', 'bench', path]))
+
+            # Both variants must print the same text
+            if outputs[0] != outputs[1]:
+                print('ERROR: output differs')
+                sys.exit(1)
+    finally:
+        shutil.rmtree(root)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+# Modm - Modules iMproved
+# Copyright (C) 2013-2014  Michael Schlottke
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+# Micro-benchmark for path variables: compares `PathList` with a plain list
+# for the operations used when loading and unloading modules (prepend, append,
+# and removing the first/last occurrence of a path) on long paths.
+
+# System imports
+import timeit
+
+# Project imports (`synthtree` makes the Modm modules importable)
+import synthtree
+from env import PathList
+
+def list_ops(initial, paths):
+    """Load and unload `paths` using a plain list."""
+    l = list(initial)
+    for p in paths:
+        l.insert(0, p)
+        l.append(p)
+    for p in paths:
+        if p in l:
+            l.remove(p)
+        if p in l:
+            del l[-1-l[::-1].index(p)]
+    return l
+
+def pathlist_ops(initial, paths):
+    """Load and unload `paths` using `PathList`."""
+    l = PathList(initial)
+    for p in paths:
+        l.prepend(p)
+        l.append(p)
+    for p in paths:
+        l.remove_first(p)
+        l.remove_last(p)
+    return l
+
+def main():
+    repeat = 20
+    print('{0:>8} {1:>8} {2:>10} {3:>14} {4:>8}'.format(
+        'entries', 'ops', 'list [ms]', 'PathList [ms]', 'speedup'))
+    for entries, ops in [(30, 10), (300, 50), (300, 300), (3000, 300)]:
+        initial = ['/usr/initial/{i}/bin'.format(i=i) for i in range(entries)]
+        paths = ['/opt/module/{i}/bin'.format(i=i) for i in range(ops)]
+        assert list(pathlist_ops(initial, paths)) == list_ops(initial, paths)
+
+        t_list = min(timeit.repeat(lambda: list_ops(initial, paths),
+                                   number=1, repeat=repeat)) * 1000
+        t_pathlist = min(timeit.repeat(lambda: pathlist_ops(initial, paths),
+                                       number=1, repeat=repeat)) * 1000
+        print('{0:>8} {1:>8} {2:>10.3f} {3:>14.3f} {4:>7.1f}x'.format(
+            entries, ops, t_list, t_pathlist, t_list / t_pathlist))
+
+if __name__ == '__main__':
+    main()
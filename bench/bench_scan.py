@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+# Modm - Modules iMproved
+# Copyright (C) 2013-2014  Michael Schlottke
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+
+# Benchmark for scanning the modules path on a high-latency file system (e.g.
+# NFS): each file system call is delayed by a fixed latency to simulate a
+# network round trip, and the time to build the module index from scratch is
+# measured for different numbers of scan threads. The number of file system
+# calls is printed as well. Usage: bench_scan.py [latency in ms]
+
+# System imports
+import os
+import shutil
+import sys
+import tempfile
+import time
+try:
+    import builtins
+except ImportError:
+    import __builtin__ as builtins
+
+# Project imports
+from synthtree import make_tree
+from modindex import ModuleIndex
+
+# Tree sizes as (module directories, modules per directory, versions per
+# module) and numbers of threads to measure
+sizes = [(1, 200, 3), (3, 200, 3), (5, 500, 2)]
+threads = [1, 2, 4, 8, 16, 32]
+
+class Latency:
+    """
+    Class to delay and count all file system calls used for scanning.
+    """
+
+    functions = [(os, 'listdir'), (os, 'stat'), (builtins, 'open')]
+    if hasattr(os, 'scandir'):
+        functions.append((os, 'scandir'))
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+        self.originals = []
+
+    def install(self):
+        for obj, name in self.functions:
+            original = getattr(obj, name)
+            self.originals.append((obj, name, original))
+            setattr(obj, name, self.delayed(original))
+
+    def uninstall(self):
+        for obj, name, original in self.originals:
+            setattr(obj, name, original)
+        self.originals = []
+
+    def delayed(self, function):
+        def wrapper(*args, **kwargs):
+            self.calls += 1
+            time.sleep(self.latency)
+            return function(*args, **kwargs)
+        return wrapper
+
+def measure(directories, nthreads, latency):
+    """Return time and number of file system calls to scan `directories`."""
+    index = ModuleIndex(threads=nthreads)
+    fs = Latency(latency)
+    fs.install()
+    try:
+        start = time.time()
+        modules = index.get_modules(directories)
+        elapsed = time.time() - start
+    finally:
+        fs.uninstall()
+    return elapsed, fs.calls, len(modules)
+
+def main():
+    latency = float(sys.argv[1]) / 1000 if len(sys.argv) > 1 else 0.001
+    print('latency: {0:.1f} ms'.format(latency * 1000))
+    print('{0:>6} {1:>8} {2:>9} {3:>8} {4:>10} {5:>8}'.format(
+        'paths', 'modules', 'versions', 'threads', 'time [s]', 'fs calls'))
+    for paths, modules, versions in sizes:
+        root = tempfile.mkdtemp(prefix='modm-bench-')
+        try:
+            directories = make_tree(root, modules=modules, versions=versions,
+                                    paths=paths, lines=1)
+            for nthreads in threads:
+                elapsed, calls, _ = measure(directories, nthreads, latency)
+                print('{0:>6} {1:>8} {2:>9} {3:>8} {4:>10.3f} {5:>8}'.format(
+                    paths, modules, versions, nthreads, elapsed, calls))
+                sys.stdout.flush()
+        finally:
+            shutil.rmtree(root)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+# Modm - Modules iMproved
+# Copyright (C) 2013-2014  Michael Schlottke
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+# Benchmark for the startup time of Modm: measures the wall-clock time from
+# process start until all output was written for each subcommand, both for
+# the `modm-init.sh` entry point (modmclient.py) and for running modm.py
+# directly. Usage: bench_startup.py [repetitions]
+
+# System imports
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# Project imports
+from synthtree import make_tree
+
+# Path to Modm installation
+modm_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# Subcommands to measure
+commands = [['--version'], ['help'], ['help', 'load'], ['list'],
+            ['avail'], ['config', 'mod1'], ['load', 'mod1'],
+            ['unload', 'mod1']]
+
+def measure(script, args, environ, repeat):
+    """Return the minimum wall-clock time of running `script` with `args`."""
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        p = subprocess.Popen([sys.executable, script] + args, env=environ,
+                             stdout=subprocess.PIPE)
+        p.communicate()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    root = tempfile.mkdtemp(prefix='modm-bench-')
+    try:
+        directories = make_tree(root, modules=500, versions=3)
+        environ = dict(os.environ)
+        environ['MODM_MODULES_PATH'] = os.pathsep.join(directories)
+        environ['MODM_LOADED_MODULES'] = os.path.join(directories[0], 'mod1',
+                                                      '0.0')
+        environ['MODM_CACHE_DIR'] = os.path.join(root, 'cache')
+        environ['MODM_PY'] = os.path.join(modm_dir, 'modm.py')
+        environ.pop('MODM_SERVER_SOCKET', None)
+
+        client = os.path.join(modm_dir, 'modmclient.py')
+        direct = os.path.join(modm_dir, 'modm.py')
+
+        # Warm up caches (index, compiled module files, byte code)
+        for args in commands:
+            measure(client, args, environ, 1)
+
+        print('{0:<16} {1:>12} {2:>12}'.format(
+            'command', 'client [ms]', 'modm.py [ms]'))
+        for args in commands:
+            print('{0:<16} {1:>12.1f} {2:>12.1f}'.format(
+                ' '.join(args),
+                measure(client, args, environ, repeat) * 1000,
+                measure(direct, args, environ, repeat) * 1000))
+    finally:
+        shutil.rmtree(root)
+
+if __name__ == '__main__':
+    main()
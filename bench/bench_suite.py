@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+
+# Modm - Modules iMproved
+# Copyright (C) 2013-2014  Michael Schlottke
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+
+# Benchmark suite for the scaling of the Modm commands: generates synthetic
+# module trees of growing size (number of module directories, modules and
+# versions, with categories, default versions and help files) and measures
+# 'avail', 'list', 'load' and 'unload' through `Modm(argv).run()`. The results
+# can be saved to a JSON file and compared with the results of an earlier run,
+# e.g. of another commit:
+#
+#   bench_suite.py --output before.json
+#   (switch to other commit)
+#   bench_suite.py --output after.json --compare before.json
+
+# System imports
+import json
+import optparse
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# Project imports
+from synthtree import make_tree
+from modm import Modm
+
+# Tree sizes as (module directories, modules per directory, versions per
+# module). The default set runs in a few minutes, the full set covers the
+# largest installations that Modm should handle.
+scenarios = [(1, 100, 1), (1, 1000, 5), (3, 1000, 5), (5, 2000, 2),
+             (1, 5000, 1), (1, 100, 100)]
+full_scenarios = scenarios + [(1, 20000, 1), (5, 20000, 1), (1, 1000, 100),
+                              (5, 5000, 5)]
+
+# Pattern to extract exported and unset variables from a Modm command string
+# (messages are matched as well, so that their content is skipped; single
+# quotes in exported values are quoted as '\'')
+statement_pattern = re.compile(r"""printf "(?:[^"\\]|\\.)*"|"""
+                               r"""export (\w+)='((?:[^']|'\\'')*)'|"""
+                               r"""unset (\w+)""")
+
+def run(argv, environ):
+    """Run Modm with `argv` and environment `environ`, and return its output
+    together with the elapsed time."""
+    stream = Buffer()
+    start = time.time()
+    Modm(['modm.py'] + argv, environ=environ).run(stream)
+    return stream.getvalue(), time.time() - start
+
+class Buffer:
+    """
+    Class to collect the output of Modm (faster than StringIO for the large
+    output of 'avail').
+    """
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, s):
+        self.parts.append(s)
+
+    def getvalue(self):
+        return ''.join(self.parts)
+
+def apply_exports(output, environ):
+    """Apply all variables exported or unset in `output` to `environ`."""
+    for name, value, unset in statement_pattern.findall(output):
+        if name:
+            environ[name] = value.replace("'\\''", "'")
+        elif unset:
+            environ.pop(unset, None)
+
+def measure(argv, environ, repeat):
+    """Return the minimum and median time of running Modm `repeat` times."""
+    times = sorted([run(argv, environ)[1] for _ in range(repeat)])
+    return times[0], times[len(times) // 2]
+
+def bench_scenario(root, paths, modules, versions, nload, repeat, use_cache):
+    """Create a module tree in `root` and return the results of all commands
+    as a list of (command, minimum time, median time) tuples."""
+    directories = make_tree(root, modules=modules, versions=versions,
+                            paths=paths, lines=5)
+    environ = dict(os.environ)
+    environ[Modm.modules_path_var] = os.pathsep.join(directories)
+    environ[Modm.cache_dir_var] = os.path.join(root, 'cache')
+    environ[Modm.cache_setting_var] = 'on' if use_cache else 'off'
+    environ[Modm.color_setting_var] = 'off'
+    environ.pop(Modm.modules_loaded_var, None)
+
+    # Modules to load are spread evenly over the whole tree
+    step = max(1, modules // nload)
+    names = ['mod{m}'.format(m=m) for m in range(0, modules, step)][:nload]
+
+    # Warm up caches (if enabled)
+    if use_cache:
+        run(['avail'], environ)
+        run(['load'] + names, environ)
+
+    # Get the environment with all modules loaded for 'list' and 'unload'
+    loaded = dict(environ)
+    apply_exports(run(['load'] + names, environ)[0], loaded)
+
+    return [('avail',) + measure(['avail'], environ, repeat),
+            ('load',) + measure(['load'] + names, environ, repeat),
+            ('list',) + measure(['list'], loaded, repeat),
+            ('unload',) + measure(['unload'] + names, loaded, repeat)]
+
+def get_revision():
+    """Return the current git revision of Modm or None if unknown."""
+    try:
+        p = subprocess.Popen(['git', 'rev-parse', '--short', 'HEAD'],
+                             cwd=os.path.dirname(os.path.realpath(__file__)),
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, _ = p.communicate()
+    except OSError:
+        return None
+    return out.decode('utf-8').strip() if p.returncode == 0 else None
+
+def scenario_name(paths, modules, versions):
+    """Return name of scenario to identify it in the results."""
+    return '{p}x{m}x{v}'.format(p=paths, m=modules, v=versions)
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('-r', '--repeat', type='int', default=5,
+                      help='number of repetitions per command (default: 5)')
+    parser.add_option('-n', '--load', type='int', default=10, dest='nload',
+                      help='number of modules to load/unload (default: 10)')
+    parser.add_option('-f', '--full', action='store_true', default=False,
+                      help='include the largest trees (up to 100k versions)')
+    parser.add_option('-c', '--cache', action='store_true', default=False,
+                      help='measure with a warm persistent cache (default: '
+                      + 'cache disabled)')
+    parser.add_option('-o', '--output', metavar='FILE',
+                      help='save results as JSON to FILE')
+    parser.add_option('--compare', metavar='FILE',
+                      help='compare results with earlier results from FILE')
+    options, _ = parser.parse_args()
+
+    # Load earlier results for comparison
+    baseline = dict()
+    if options.compare:
+        with open(options.compare, 'r') as f:
+            for r in json.load(f)['results']:
+                baseline[(r['scenario'], r['command'])] = r['min']
+
+    print('{0:<16} {1:<8} {2:>10} {3:>10} {4:>8}'.format(
+        'scenario', 'command', 'min [ms]', 'med [ms]', 'ratio'))
+    results = []
+    for paths, modules, versions in (full_scenarios if options.full
+                                     else scenarios):
+        name = scenario_name(paths, modules, versions)
+        root = tempfile.mkdtemp(prefix='modm-bench-')
+        try:
+            for command, tmin, tmed in bench_scenario(
+                    root, paths, modules, versions, options.nload,
+                    options.repeat, options.cache):
+                results.append({'scenario': name, 'command': command,
+                                'min': tmin, 'median': tmed})
+                base = baseline.get((name, command))
+                print('{0:<16} {1:<8} {2:>10.1f} {3:>10.1f} {4:>8}'.format(
+                    name, command, tmin * 1000, tmed * 1000,
+                    '{0:.2f}'.format(tmin / base) if base else '-'))
+                sys.stdout.flush()
+        finally:
+            shutil.rmtree(root)
+
+    # Save results
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump({'revision': get_revision(),
+                       'python': platform.python_version(),
+                       'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+                       'repeat': options.repeat, 'load': options.nload,
+                       'cache': options.cache, 'results': results}, f,
+                      indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+# Modm - Modules iMproved
+# Copyright (C) 2013-2014  Michael Schlottke
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+# System imports
+import os
+import sys
+
+# Make Modm modules importable from the benchmark scripts
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(
+    __file__))))
+
+def make_tree(root, modules=100, versions=1, paths=1, categories=10,
+              lines=5):
+    """Create a synthetic module tree below `root` and return the list of
+    module directories (suitable for MODM_MODULES_PATH).
+
+    Arguments:
+      root       -- directory in which the module directories are created
+      modules    -- number of modules per module directory
+      versions   -- number of versions per module
+      paths      -- number of module directories
+      categories -- number of distinct categories (0 means no categories)
+      lines      -- number of commands per module file
+    """
+    directories = []
+    for p in range(paths):
+        directory = os.path.join(root, 'modules{p}'.format(p=p))
+        directories.append(directory)
+        for m in range(modules):
+            name = 'mod{m}'.format(m=m)
+            modpath = os.path.join(directory, name)
+            os.makedirs(modpath)
+
+            # Create module files (later module directories contribute
+            # additional versions of the same modules)
+            for v in range(versions):
+                version = '{p}.{v}'.format(p=p, v=v)
+                with open(os.path.join(modpath, version), 'w') as f:
+                    for l in range(lines):
+                        f.write('prepend_path PATH /opt/{n}/{v}/bin{l}\n'
+                                .format(n=name, v=version, l=l))
+                    f.write('set {n}_VERSION "{v}"\n'.format(
+                        n=name.upper(), v=version))
+
+            # Create special files for every other module
+            if m % 2 == 0:
+                with open(os.path.join(modpath, '.default'), 'w') as f:
+                    f.write('{p}.0\n'.format(p=p))
+                with open(os.path.join(modpath, '.help'), 'w') as f:
+                    f.write('Help for module {n}.\n'.format(n=name))
+            if categories > 0:
+                with open(os.path.join(modpath, '.category'), 'w') as f:
+                    f.write('category{c}\n'.format(c=m % categories))
+    return directories
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+
+# Modm - Modules iMproved
+# Copyright (C) 2013-2014  Michael Schlottke
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+# System imports
+import os
+
+class Cache:
+    """
+    Class to store data persistently in a per-user cache directory.
+
+    Each item is stored in its own file in JSON format. Item names may contain
+    a path separator to group items in subdirectories. Since the cache only
+    holds data that can be recomputed at any time, all errors while reading or
+    writing are silently ignored.
+    """
+
+    file_suffix = '.json'
+    format_version = 1
+    ledger_suffix = '.ledger'
+    ledger_check_interval = 100
+    prune_ratio = 0.9
+
+    def __init__(self, directory):
+        """Save cache directory. The directory is only created once the first
+        item is stored.
+
+        Arguments:
+          directory -- path to directory where cache files are stored
+        """
+        self.directory = directory
+        self.changes = dict()
+
+    def get_path(self, name):
+        """Return path to cache file for item `name`."""
+        return os.path.join(self.directory, name + self.file_suffix)
+
+    def load(self, name):
+        """Return data stored for item `name` or None if it was not found or
+        could not be read."""
+        import json
+        try:
+            with open(self.get_path(name), 'r') as f:
+                content = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+        # Discard data written by an incompatible version of Modm
+        if not isinstance(content, dict) or (
+                content.get('version') != self.format_version):
+            return None
+        return content.get('data')
+
+    def store(self, name, data):
+        """Store `data` for item `name`.
+
+        The data is first written to a temporary file that is then renamed, so
+        that concurrent readers never see a partially written file. Return
+        true if the data was stored successfully, otherwise false.
+        """
+        import json
+        path = self.get_path(name)
+        tmppath = '{p}.{pid}.tmp'.format(p=path, pid=os.getpid())
+        try:
+            directory = os.path.dirname(path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(tmppath, 'w') as f:
+                json.dump({'version': self.format_version, 'data': data}, f,
+                          separators=(',', ':'))
+                size = f.tell()
+            old_size = self.get_size(path)
+            os.rename(tmppath, path)
+        except (IOError, OSError):
+            # Clean up temporary file if it was created
+            if os.path.isfile(tmppath):
+                try:
+                    os.remove(tmppath)
+                except OSError:
+                    pass
+            return False
+        if old_size is None:
+            self.record_change(name, 1, size)
+        else:
+            self.record_change(name, 0, size - old_size)
+        return True
+
+    def remove(self, name):
+        """Remove item `name` if it exists."""
+        path = self.get_path(name)
+        size = self.get_size(path)
+        try:
+            os.remove(path)
+        except OSError:
+            return
+        if size is not None:
+            self.record_change(name, -1, -size)
+
+    def get_size(self, path):
+        """Return size of file `path` or None if it does not exist."""
+        try:
+            return os.stat(path).st_size
+        except OSError:
+            return None
+
+    def record_change(self, name, items, size):
+        """Remember that the number of items and their total size changed by
+        `items` and `size` in the group of item `name` until the ledger of the
+        group is updated by `prune`."""
+        group = os.path.dirname(name)
+        count, total = self.changes.get(group, (0, 0))
+        self.changes[group] = (count + items, total + size)
+
+    def prune(self, group, max_items, max_bytes=None):
+        """Remove the least recently stored items in subdirectory `group` until
+        at most `max_items` items are left and, if `max_bytes` is given, their
+        files take up at most `max_bytes` bytes in total.
+
+        The number and total size of the items in the group are kept in a
+        ledger next to its subdirectory, which is updated with the changes
+        made since the last call. The files are only listed when the ledger
+        exceeds the limits, is missing, or every `ledger_check_interval`
+        calls, which also corrects updates lost to concurrent processes. If
+        the limits are exceeded, items are removed until the group is below
+        `prune_ratio` times the limits, so that the next calls do not have to
+        list the files again.
+        """
+        ledger_name = group + self.ledger_suffix
+        ledger = self.load(ledger_name)
+        count, total = self.changes.pop(group, (0, 0))
+        if isinstance(ledger, dict):
+            ledger = {'items': ledger.get('items', 0) + count,
+                      'bytes': ledger.get('bytes', 0) + total,
+                      'updates': ledger.get('updates', 0) + 1}
+            if (ledger['items'] <= max_items and
+                    (max_bytes is None or ledger['bytes'] <= max_bytes) and
+                    ledger['updates'] < self.ledger_check_interval):
+                self.store(ledger_name, ledger)
+                return
+
+        # Recount all items and remove the oldest ones
+        directory = os.path.join(self.directory, group)
+        try:
+            items = []
+            for f in os.listdir(directory):
+                if f.endswith(self.file_suffix):
+                    path = os.path.join(directory, f)
+                    st = os.stat(path)
+                    items.append((st.st_mtime, st.st_size, path))
+            items.sort()
+            count = len(items)
+            total = sum([size for _, size, _ in items])
+            if count > max_items or (
+                    max_bytes is not None and total > max_bytes):
+                max_items = int(max_items * self.prune_ratio)
+                if max_bytes is not None:
+                    max_bytes = int(max_bytes * self.prune_ratio)
+            for _, size, path in items:
+                if count <= max_items and (
+                        max_bytes is None or total <= max_bytes):
+                    break
+                os.remove(path)
+                count -= 1
+                total -= size
+        except OSError:
+            return
+        self.store(ledger_name, {'items': count, 'bytes': total,
+                                 'updates': 0})
@@ -20,29 +20,47 @@
 
 # System imports
 import os
+from collections import deque
 
 class Env:
     """
     Class to handle environment variables in an easy way.
     """
 
+    # Maximum length of the load journal in characters (entries that do not
+    # fit are dropped, cf. `get_journal_str()`)
+    journal_max_length = 32768
+
     def __init__(self, modpath_var='MODM_MODULES_PATH',
-                 modloaded_var='MODM_LOADED_MODULES'):
+                 modloaded_var='MODM_LOADED_MODULES', environ=None,
+                 journal_var='MODM_LOAD_JOURNAL',
+                 path_refs_var='MODM_PATH_REFS'):
         """Save arguments and initialize variables for the module paths as well
         as the loaded modules.
 
         Arguments:
           modpath_var   -- environment variable for the modules path
           modloaded_var -- environment variable for the loaded modules
+          environ       -- mapping with the environment variables to use
+                           (default: `os.environ`)
+          journal_var   -- environment variable for the load journal
+          path_refs_var -- environment variable for the reference counts of
+                           path entries
         """
         # Save arguments
         self.modpath_var = modpath_var
         self.modloaded_var = modloaded_var
+        self.environ = os.environ if environ is None else environ
+        self.journal_var = journal_var
+        self.path_refs_var = path_refs_var
 
         # Init other members
         self.modpath = self.load_path(modpath_var)
         self.modloaded = self.load_path(modloaded_var)
         self.variables = dict()
+        self.journal = None
+        self.is_journal_modified = False
+        self.path_refs = None
 
     def load_path(self, variable):
         """Load a environment variable and return it as a list of paths."""
@@ -51,7 +69,8 @@ class Env:
 
     def load_string(self, variable):
         """Load a environment variable and return it as a string."""
-        return os.environ[variable] if variable in os.environ else None
+        return (self.environ[variable] if variable in self.environ
+                else None)
 
     def get_modloaded_str(self):
         """Return loaded modules as a single string."""
@@ -66,6 +85,152 @@ class Env:
         if module in self.modloaded:
             self.modloaded.remove(module)
 
+    def load_journal(self):
+        """Load the load journal from the environment if not yet done.
+
+        The journal maps each loaded module file to the compiled commands
+        that were executed when it was loaded (as lists with the command
+        followed by its arguments), so that it can be unloaded without reading
+        the module file again.
+        """
+        if self.journal is not None:
+            return
+        self.journal = dict()
+        value = self.load_string(self.journal_var)
+        if value:
+            import json
+            try:
+                journal = json.loads(value)
+            except ValueError:
+                return
+            if isinstance(journal, dict):
+                self.journal = journal
+
+    def get_journal_entry(self, module, nargs):
+        """Return list of (command, arguments) tuples executed when `module`
+        was loaded, or None if `module` is not in the journal or its entry is
+        invalid (e.g., because the variable was modified by hand).
+
+        Arguments:
+          module -- module file of the loaded module
+          nargs  -- dictionary with the number of arguments of each valid
+                    command (cf. `ModfileParser.nargs`)
+        """
+        self.load_journal()
+        entry = self.journal.get(module)
+        if not isinstance(entry, list):
+            return None
+        strings = (str, type(u''))
+        for c in entry:
+            if not isinstance(c, list) or len(c) == 0 or (
+                    not isinstance(c[0], strings) or
+                    nargs.get(c[0]) != len(c) - 1):
+                return None
+            for arg in c[1:]:
+                if not isinstance(arg, strings):
+                    return None
+        return [(c[0], tuple(c[1:])) for c in entry]
+
+    def set_journal_entry(self, module, commands):
+        """Record list of (command, arguments) tuples `commands` that were
+        executed when `module` was loaded."""
+        self.load_journal()
+        self.journal[module] = [[cmd] + list(args) for cmd, args in commands]
+        self.is_journal_modified = True
+
+    def remove_journal_entry(self, module):
+        """Remove `module` from the journal if present."""
+        self.load_journal()
+        if module in self.journal:
+            del self.journal[module]
+            self.is_journal_modified = True
+
+    def load_path_refs(self):
+        """Load reference counts of path entries from the environment if not
+        yet done."""
+        if self.path_refs is not None:
+            return
+        self.path_refs = dict()
+        value = self.load_string(self.path_refs_var)
+        if value:
+            import json
+            try:
+                path_refs = json.loads(value)
+            except ValueError:
+                return
+            if isinstance(path_refs, dict):
+                self.path_refs = path_refs
+
+    def get_path_refs(self, name):
+        """Return dictionary with the reference counts of the entries of path
+        variable `name` (cf. `EnvVariable`), which may be modified in place.
+
+        Only counts greater than one are stored, entries that are present but
+        not recorded have a count of one.
+        """
+        self.load_path_refs()
+        return self.path_refs.setdefault(name, dict())
+
+    def get_state(self):
+        """Return snapshot of all variables, the loaded modules, the journal
+        and the reference counts of path entries (cf. `set_state()`)."""
+        self.load_journal()
+        self.load_path_refs()
+        return (dict([(n, v.get_state()) for n, v in self.variables.items()]),
+                list(self.modloaded), dict(self.journal),
+                self.is_journal_modified,
+                dict([(n, dict(r)) for n, r in self.path_refs.items()]))
+
+    def set_state(self, state):
+        """Restore snapshot `state` returned by `get_state()`, i.e. undo all
+        changes since then."""
+        (variables, self.modloaded, self.journal, self.is_journal_modified,
+         path_refs) = state
+
+        # Restore variables and forget about variables created since then
+        for name in list(self.variables):
+            if name in variables:
+                self.variables[name].set_state(variables[name])
+            else:
+                del self.variables[name]
+
+        # Reference counts are restored in place, since they are shared with
+        # the variables
+        for name, refs in self.path_refs.items():
+            refs.clear()
+            refs.update(path_refs.get(name, dict()))
+
+    def get_path_refs_str(self):
+        """Return reference counts of all path variables as a single string
+        (empty if there are no counts), or None if they were not used."""
+        if self.path_refs is None:
+            return None
+        import json
+        path_refs = dict([(n, r) for n, r in self.path_refs.items() if r])
+        if not path_refs:
+            return ''
+        return json.dumps(path_refs, separators=(',', ':'), sort_keys=True)
+
+    def get_journal_str(self):
+        """Return journal of all loaded modules as a single string (empty if
+        there are no entries).
+
+        Entries of modules that are no longer loaded are dropped. If the
+        journal gets too long, the entries of the most recently loaded modules
+        are dropped as well (these modules are unloaded by reading their
+        module files again).
+        """
+        import json
+        self.load_journal()
+        modules = [m for m in self.modloaded if m in self.journal]
+        while modules:
+            value = json.dumps(dict([(m, self.journal[m]) for m in modules]),
+                               separators=(',', ':'), sort_keys=True)
+            if len(value) <= self.journal_max_length:
+                return value
+            modules.pop()
+        return ''
+
 
 class EnvVariable:
     """
@@ -77,20 +242,30 @@ class EnvVariable:
 
     kinds = ['string', 'path']
 
-    def __init__(self, name, kind='string'):
+    def __init__(self, name, kind='string', environ=None, refs=None):
         """Set name and kind of variable, and load value if it exists.
 
         Arguments:
-          name -- name of variable
-          kind -- kind of variable (may be 'string' or 'path')
+          name    -- name of variable
+          kind    -- kind of variable (may be 'string' or 'path')
+          environ -- mapping with the environment variables to load the value
+                     from (default: `os.environ`)
+          refs    -- dictionary with the reference counts of path entries
+                     (cf. `Env.get_path_refs()`); if given, a path that is
+                     already present is not added again but its count is
+                     increased, and undoing removes it only once the count
+                     drops to zero
         """
         # Save arguments
         self._name = name
         self._kind = kind
+        self._environ = os.environ if environ is None else environ
+        self._refs = refs
 
-        # Init value
+        # Init value and remember the value from the environment
         self._value = None
         self.load()
+        self._initial = self.get_value()
 
         # Init other members
         self._modified = False
@@ -99,12 +274,12 @@ class EnvVariable:
     def load(self):
         """Load variable from environment if it exists."""
         # Set value if environment variable exists
-        self._value = (os.environ[self._name] if self._name in os.environ
-                       else None)
+        self._value = (self._environ[self._name] if self._name in
+                       self._environ else None)
         # If variable exists and is a path, split it into individual paths
         if self._value is not None and self._kind == 'path':
-            self._value = (self._value.split(os.path.pathsep) if self._value
-                           else [])
+            self._value = PathList(self._value.split(os.path.pathsep)
+                                   if self._value else [])
 
     def is_set(self):
         """Return true if the variable has been set."""
@@ -118,6 +293,15 @@ class EnvVariable:
         """Return true if this value was marked to be unset."""
         return self._unset
 
+    def is_changed(self):
+        """Return true if the current value differs from the value in the
+        environment (e.g. a path that was prepended and removed again does not
+        change the variable). An empty path variable is considered equal to an
+        unset one."""
+        if self._initial is None and self._kind == 'path' and not self._value:
+            return False
+        return self.get_value() != self._initial
+
     def get_name(self):
         """Get name of variable."""
         return self._name
@@ -133,6 +317,20 @@ class EnvVariable:
         else:
             return self._value
 
+    def get_state(self):
+        """Return snapshot of the value and the flags of the variable (cf.
+        `set_state()`)."""
+        return self.get_value(), self._modified, self._unset
+
+    def set_state(self, state):
+        """Restore snapshot `state` returned by `get_state()`."""
+        value, self._modified, self._unset = state
+        if value is not None and self._kind == 'path':
+            self._value = PathList(value.split(os.path.pathsep)
+                                   if value else [])
+        else:
+            self._value = value
+
     def get_export(self):
         """Return name, value tuple that can be used to export the variables."""
         return self.get_name(), self.get_value()
@@ -144,12 +342,13 @@ class EnvVariable:
             return
         # Otherwise initialize it as a path or string variable
         elif self._kind == 'path':
-            self._value = []
+            self._value = PathList()
         else:
             self._value = ''
 
-        # Mark variable as modified
+        # Mark variable as modified (and no longer unset)
         self._modified = True
+        self._unset = False
 
     def prepend(self, value, undo=False):
         """Prepend string or path to variable.
@@ -160,15 +359,17 @@ class EnvVariable:
         # If not undo, prepend
         if not undo:
             if self._kind == 'path':
-                self._value.insert(0, value)
+                if not self.add_reference(value):
+                    self._value.prepend(value)
             else:
                 self._value = value + self._value
         # If undo, remove from beginning
         else:
             if self._kind == 'path':
-                # If path is found in list, remove first occurrence
-                if value in self._value:
-                    self._value.remove(value)
+                # If path is found in list and not used otherwise, remove
+                # first occurrence
+                if self.remove_reference(value):
+                    self._value.remove_first(value)
             else:
                 self._value = self._value.replace(value, '', 1)
 
@@ -184,28 +385,148 @@ class EnvVariable:
         # If not undo, append
         if not undo:
             if self._kind == 'path':
-                self._value.append(value)
+                if not self.add_reference(value):
+                    self._value.append(value)
             else:
                 self._value = self._value + value
         # If undo, remove from end
         else:
             if self._kind == 'path':
-                # If path is found in list, remove last occurrence
-                if value in self._value:
-                    del self._value[-1-l[::-1].index(value)]
+                # If path is found in list and not used otherwise, remove
+                # last occurrence
+                if self.remove_reference(value):
+                    self._value.remove_last(value)
             else:
                 self._value = ''.join(self._value.rsplit(value, 1))
 
         # Mark variable as modified
         self._modified = True
 
+    def add_reference(self, path):
+        """Increase reference count of `path` if reference counting is used
+        and it is present. Return true if it is present in this case (thus it
+        must not be added again), otherwise false."""
+        if self._refs is None:
+            return False
+        if path not in self._value:
+            # Forget about counts of paths that were removed otherwise
+            self._refs.pop(path, None)
+            return False
+        self._refs[path] = self._refs.get(path, 1) + 1
+        return True
+
+    def remove_reference(self, path):
+        """Decrease reference count of `path` if reference counting is used
+        and it is present. Return true if `path` needs to be removed (i.e. its
+        count dropped to zero or no reference counting is used)."""
+        if self._refs is None:
+            return True
+        if path not in self._value:
+            self._refs.pop(path, None)
+            return True
+        count = self._refs.pop(path, 1) - 1
+        if count > 1:
+            self._refs[path] = count
+        return count <= 0
+
     def set_value(self, value):
-        """Set variable value to `value` (do not consider variable kind)."""
+        """Set variable value to `value` (for path variables, `value` is split
+        into individual paths)."""
         self.init_variable()
-        self._value = value
+        if self._kind == 'path':
+            self._value = PathList(value.split(os.path.pathsep)
+                                   if value else [])
+        else:
+            self._value = value
         self._modified = True
 
     def unset(self):
         """Mark variable as unset."""
+        self._value = None
         self._unset = True
         self._modified = True
+
+
+class PathList:
+    """
+    Class to represent an ordered list of paths.
+
+    The paths are stored in a doubly linked list. Additionally, the list nodes
+    of all occurrences of each path are kept in order, thus checking whether a
+    path is present, prepending, appending, and removing the first or last
+    occurrence of a path all take constant time.
+    """
+
+    # Indices of the fields in each list node
+    PREV, NEXT, PATH = 0, 1, 2
+
+    def __init__(self, paths=[]):
+        """Initialize list with the given `paths`."""
+        # The root node links to the first and last node of the list
+        self._root = []
+        self._root[:] = [self._root, self._root, None]
+
+        # Map from path to the nodes of its occurrences
+        self._nodes = dict()
+        self._length = 0
+
+        for path in paths:
+            self.append(path)
+
+    def __len__(self):
+        """Return number of paths (including duplicates)."""
+        return self._length
+
+    def __iter__(self):
+        """Iterate over paths in order."""
+        node = self._root[self.NEXT]
+        while node is not self._root:
+            yield node[self.PATH]
+            node = node[self.NEXT]
+
+    def __contains__(self, path):
+        """Return true if `path` is in the list."""
+        return path in self._nodes
+
+    def count(self, path):
+        """Return number of occurrences of `path`."""
+        return len(self._nodes[path]) if path in self._nodes else 0
+
+    def prepend(self, path):
+        """Insert `path` at the beginning of the list."""
+        first = self._root[self.NEXT]
+        node = [self._root, first, path]
+        first[self.PREV] = self._root[self.NEXT] = node
+        self._nodes.setdefault(path, deque()).appendleft(node)
+        self._length += 1
+
+    def append(self, path):
+        """Insert `path` at the end of the list."""
+        last = self._root[self.PREV]
+        node = [last, self._root, path]
+        last[self.NEXT] = self._root[self.PREV] = node
+        self._nodes.setdefault(path, deque()).append(node)
+        self._length += 1
+
+    def remove_first(self, path):
+        """Remove first occurrence of `path`. Return true if it was found."""
+        if path not in self._nodes:
+            return False
+        self._unlink(self._nodes[path].popleft(), path)
+        return True
+
+    def remove_last(self, path):
+        """Remove last occurrence of `path`. Return true if it was found."""
+        if path not in self._nodes:
+            return False
+        self._unlink(self._nodes[path].pop(), path)
+        return True
+
+    def _unlink(self, node, path):
+        """Remove `node` with `path` from the linked list."""
+        prev, next = node[self.PREV], node[self.NEXT]
+        prev[self.NEXT] = next
+        next[self.PREV] = prev
+        if not self._nodes[path]:
+            del self._nodes[path]
+        self._length -= 1
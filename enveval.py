@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+# Modm - Modules iMproved
+# Copyright (C) 2013-2014  Michael Schlottke
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+
+# Project imports
+from basheval import BashEval
+
+class EnvEval(BashEval):
+    """
+    Class to output the net modifications of the environment in a
+    machine-readable format instead of as commands for Bash's `eval`.
+
+    Supported formats are:
+
+      json -- a single JSON object with the variables that are set (`set`),
+              the variables that are unset (`unset`), the printed messages
+              (`messages`) and the error messages (`errors`)
+      nul  -- one record per variable, terminated by a NUL character: either
+              'NAME=VALUE' if the variable is set or 'NAME' if it is unset;
+              messages are written to the display (e.g. stderr)
+
+    Messages are never highlighted.
+    """
+
+    formats = ['json', 'nul']
+
+    def __init__(self, output_format='json', display=None):
+        """Save arguments and initialize member variables.
+
+        Arguments:
+          output_format -- output format (one of `formats`)
+          display       -- file object to which messages are written
+                           directly (only used by the 'nul' format)
+        """
+        BashEval.__init__(self, use_colors=False,
+                          display=display if output_format == 'nul' else None)
+        self.output_format = output_format
+        self.variables = dict()
+        self.errors = []
+
+    def clear(self):
+        """Clear all previously issued commands and messages."""
+        BashEval.clear(self)
+        self.variables = dict()
+        self.errors = []
+
+    def peek(self):
+        """Get output in the selected format without clearing it."""
+        if self.output_format == 'nul':
+            return ''.join([(k if v is None else k + '=' + v) + '\0'
+                            for k, v in sorted(self.variables.items())])
+
+        import json
+        return json.dumps({'set': dict([(k, v) for k, v in
+                                        self.variables.items()
+                                        if v is not None]),
+                           'unset': sorted([k for k, v in
+                                            self.variables.items()
+                                            if v is None]),
+                           'messages': ''.join(self.messages),
+                           'errors': self.errors}, sort_keys=True) + '\n'
+
+    def execute(self, cmd):
+        """Ignore `cmd`, since arbitrary commands cannot be represented in the
+        output formats."""
+        pass
+
+    def echo_rendered(self, text):
+        """Collect `text` that was returned by `render()` or write it to the
+        display."""
+        if self.display is not None:
+            self.display.write(text)
+        else:
+            self.messages.append(text)
+
+    def error(self, message, newline=True, internal=False):
+        """Collect error message and print it (cf. `BashEval.error()`)."""
+        self.errors.append(message)
+        BashEval.error(self, message, newline=newline, internal=internal)
+
+    def export(self, key, value):
+        """Set environment variable `key` to `value`."""
+        self.variables[key] = value
+
+    def unset(self, key):
+        """Unset environment variable `key`."""
+        self.variables[key] = None
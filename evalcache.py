@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+# Modm - Modules iMproved
+# Copyright (C) 2013-2014  Michael Schlottke
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+
+# System imports
+import os
+import time
+
+class EvalCache:
+    """
+    Class to cache the final command strings of Modm commands.
+
+    An entry is stored under a key that describes the request (e.g. command,
+    arguments and Modm settings). Together with the command string, it records
+    all inputs that influenced the result: the initial values of all
+    environment variables that were used and the fingerprints (modification
+    time and size) of all module directories and module files that were read.
+    An entry is only reused if all of these inputs are unchanged.
+    """
+
+    cache_group = 'eval'
+    cache_max_items = 1000
+
+    # Entries are not stored if one of the inputs was modified less than this
+    # many seconds ago, since a later modification within the resolution of
+    # the file system timestamps would go unnoticed
+    mtime_resolution = 2.0
+
+    def __init__(self, cache):
+        """Save object to store entries persistently."""
+        self.cache = cache
+
+    def get_name(self, key):
+        """Return name of the cache item for `key`."""
+        import json
+        import hashlib
+        return os.path.join(self.cache_group, hashlib.sha1(
+                json.dumps(key).encode('utf-8')).hexdigest())
+
+    def get_fingerprint(self, path):
+        """Return modification time and size of `path` or None if it does not
+        exist."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return [st.st_mtime, st.st_size]
+
+    def load(self, key, environ):
+        """Return command string stored for `key` or None if there is no entry
+        or if the inputs of the entry differ from the current state (using the
+        environment variables in `environ`)."""
+        data = self.cache.load(self.get_name(key))
+        if not isinstance(data, dict) or data.get('key') != key:
+            return None
+
+        # Check environment variables and files
+        for name, value in data['environ'].items():
+            if environ.get(name) != value:
+                return None
+        for path, fingerprint in data['paths'].items():
+            if self.get_fingerprint(path) != fingerprint:
+                return None
+
+        return data['output']
+
+    def store(self, key, environ, paths, output):
+        """Store command string `output` for `key`.
+
+        Arguments:
+          key     -- JSON-serializable description of the request
+          environ -- mapping with the initial values of all environment
+                     variables that were used (None if not set)
+          paths   -- list of all module directories and files that were read
+          output  -- command string
+        """
+        # Get fingerprints and skip storing if any of them is not reliable
+        fingerprints = dict()
+        now = time.time()
+        for path in paths:
+            fingerprint = self.get_fingerprint(path)
+            if fingerprint is not None and (
+                    now - fingerprint[0] < self.mtime_resolution):
+                return
+            fingerprints[path] = fingerprint
+
+        if self.cache.store(self.get_name(key), {'key': key,
+                                                 'environ': dict(environ),
+                                                 'paths': fingerprints,
+                                                 'output': output}):
+            self.cache.prune(self.cache_group, self.cache_max_items)
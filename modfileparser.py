@@ -20,36 +20,111 @@
 
 # System imports
 import os
-import shlex
+import stat
+from collections import OrderedDict
 
 # Project imports
 from env import Env,EnvVariable
 from basheval import BashEval
 
+class CompiledFiles:
+    """
+    Class to keep compiled module files in memory.
+
+    Compiled module files are stored with a key of path, modification time and
+    size of the module file. The size of the module files is used as an
+    estimate for the memory used by their compiled commands: if their total
+    size exceeds `max_bytes` (e.g., because a long-running server sees many
+    different module files), the least recently used are forgotten.
+    """
+
+    max_bytes = 32 * 1024 * 1024
+
+    def __init__(self):
+        """Initialize empty storage."""
+        self.entries = OrderedDict()
+        self.keys = dict()
+        self.total = 0
+
+    def get(self, key):
+        """Return compiled commands for `key` or None if they are unknown."""
+        commands = self.entries.pop(key, None)
+        if commands is not None:
+            # Move to the end as most recently used
+            self.entries[key] = commands
+        return commands
+
+    def add(self, key, commands):
+        """Store compiled `commands` for `key`. An older version of the same
+        module file is replaced."""
+        old = self.keys.get(key[0])
+        if old is not None:
+            self.remove(old)
+        self.entries[key] = commands
+        self.keys[key[0]] = key
+        self.total += key[2]
+
+        # Forget least recently used module files (but keep the new one)
+        while self.total > self.max_bytes and len(self.entries) > 1:
+            self.remove(next(iter(self.entries)))
+
+    def remove(self, key):
+        """Forget compiled commands for `key`."""
+        if self.entries.pop(key, None) is not None:
+            self.total -= key[2]
+            if self.keys.get(key[0]) == key:
+                del self.keys[key[0]]
+
 class ModfileParser:
     """
     Class to parse module files and execute commands found in them.
+
+    Module files may include other files with common commands ('include' or
+    'source', relative paths are relative to the including file). Includes
+    are replaced by the commands of the included file when a module file is
+    compiled, thus each file is only read once even if it is included by many
+    module files.
     """
 
     backup_prefix = 'MODM_BACKUP_'
+    cache_group = 'modfiles'
+
+    # Bounds for the compiled module files in the persistent cache (the least
+    # recently stored are removed, cf. `CompiledFiles` for the bound in memory)
+    cache_max_items = 1000
+    cache_max_bytes = 16 * 1024 * 1024
 
-    def __init__(self, env=Env(), basheval=BashEval()):
+    def __init__(self, env=None, basheval=None, cache=None, compiled=None):
         """Save arguments to class and initialize list of valid commands.
 
         Arguments:
-          env      -- object to handle environment variables
+          env      -- object to handle environment variables (default: new
+                      `Env` object)
           basheval -- object to convert commands to Bash evaluation strings
+                      (default: new `BashEval` object)
+          cache    -- object to store compiled module files persistently (if
+                      None, module files are compiled on each use)
+          compiled -- object to keep compiled module files in memory, may be
+                      shared between parsers (default: new `CompiledFiles`
+                      object)
         """
         # Save arguments
-        self.env = env
-        self.be = basheval
+        self.env = Env() if env is None else env
+        self.be = BashEval() if basheval is None else basheval
+        self.cache = cache
+        self.compiled = CompiledFiles() if compiled is None else compiled
 
         # Init commands
         self.commands = dict()
+        self.nargs = dict()
         self.init_commands()
 
         # Init other members
         self.do_unload = False
+        self.files = set()
+        self.last_commands = None
+        self.resolved = dict()
+        self.resolving = []
 
     def init_commands(self):
         """Initialize all commands that are supported in module files."""
@@ -67,12 +142,35 @@ class ModfileParser:
                 *x,
                 load=False)
         self.commands['set'] = self.cmd_set
+        self.commands['requires'] = self.cmd_declare
+        self.commands['conflicts'] = self.cmd_declare
+        self.commands['include'] = self.cmd_include
+        self.commands['source'] = self.cmd_include
+
+        # Set number of arguments for each command
+        self.nargs['prepend_path'] = 2
+        self.nargs['prepend_string'] = 2
+        self.nargs['print'] = 1
+        self.nargs['print_load'] = 1
+        self.nargs['print_unload'] = 1
+        self.nargs['set'] = 2
+        self.nargs['requires'] = 1
+        self.nargs['conflicts'] = 1
+        self.nargs['include'] = 1
+        self.nargs['source'] = 1
+
+    def create_variable(self, name, kind):
+        """Create variable `name` of kind `kind` if it does not exist yet.
+        Entries of path variables are reference counted."""
+        if not name in self.env.variables:
+            refs = self.env.get_path_refs(name) if kind == 'path' else None
+            self.env.variables[name] = EnvVariable(name, kind=kind,
+                    environ=self.env.environ, refs=refs)
 
     def cmd_prepend_variable(self, name, value, kind='string'):
         """Prepend variable `name` with `value`."""
         # Create variable if it does not exist yet
-        if not name in self.env.variables:
-            self.env.variables[name] = EnvVariable(name, kind=kind)
+        self.create_variable(name, kind)
 
         # Prepend value (or undo prepend)
         self.env.variables[name].prepend(value, undo=self.do_unload)
@@ -80,8 +178,7 @@ class ModfileParser:
     def cmd_append_variable(self, name, value, kind='string'):
         """Append variable `name` with `value`."""
         # Create variable if it does not exist yet
-        if not name in self.env.variables:
-            self.env.variables[name] = EnvVariable(name, kind=kind)
+        self.create_variable(name, kind)
 
         # Append value (or undo append)
         self.env.variables[name].append(value, undo=self.do_unload)
@@ -91,6 +188,16 @@ class ModfileParser:
         if (load and not self.do_unload) or (unload and self.do_unload):
             self.be.echo(message)
 
+    def cmd_declare(self, *args):
+        """Ignore declarations (`requires`, `conflicts`), since they are
+        handled before module files are loaded or unloaded."""
+        pass
+
+    def cmd_include(self, *args):
+        """Ignore includes (`include`, `source`), since they are resolved
+        when module files are compiled (cf. `resolve()`)."""
+        pass
+
     def cmd_set(self, name, value):
         """Set variable `name` to `value`.
 
@@ -99,13 +206,15 @@ class ModfileParser:
         """
         # Create variable if it does not exist yet
         if not name in self.env.variables:
-            self.env.variables[name] = EnvVariable(name)
+            self.env.variables[name] = EnvVariable(name,
+                    environ=self.env.environ)
 
         # Determine name of potential backup variable and create backup variable
         # if it does not exist
         backupname = self.backup_prefix + name
         if backupname not in self.env.variables:
-            self.env.variables[backupname] = EnvVariable(backupname)
+            self.env.variables[backupname] = EnvVariable(backupname,
+                    environ=self.env.environ)
 
         # If variable is to be set, check if it is already set and save backup
         if not self.do_unload:
@@ -136,38 +245,236 @@ class ModfileParser:
     def parse(self, modfile):
         """Parse module file `modfile` and execute commands that are found.
 
-        Return true if parsing was successful, otherwise false."""
+        Return true if parsing was successful, otherwise false. The executed
+        commands are kept in `last_commands`."""
         # Return without doing anything if file is not found
-        if not os.path.isfile(modfile):
+        try:
+            st = os.stat(modfile)
+        except OSError:
+            return
+        if not stat.S_ISREG(st.st_mode):
             return
 
+        # Get compiled module file or die
+        commands = self.get_commands(modfile, st)
+        if commands is None:
+            return False
+
+        # Execute commands and return true to indicate that nothing was wrong
+        self.execute(commands)
+        self.last_commands = commands
+        return True
+
+    def replay(self, commands, unload=False):
+        """Execute compiled module file `commands` (cf. `get_commands()`)
+        without reading the module file. If `unload` is true, the commands are
+        undone."""
+        self.do_unload = unload
+        self.execute(commands)
+
+    def execute(self, commands):
+        """Execute each command in `commands` while providing the arguments
+        from the module file."""
+        for cmd, args in commands:
+            self.commands[cmd](*args)
+
+    def get_compiled(self, modfile):
+        """Return tuple with modification time, size and compiled commands of
+        module file `modfile`, or None if it does not exist or is invalid.
+
+        The commands of included files are part of the compiled commands, use
+        `get_includes()` to check whether they are still valid."""
+        try:
+            st = os.stat(modfile)
+        except OSError:
+            return None
+        commands = self.get_commands(modfile, st)
+        if commands is None:
+            return None
+        return st.st_mtime, st.st_size, commands
+
+    def get_dependencies(self, modfile):
+        """Return tuple with the list of modules required by module file
+        `modfile` and the list of modules it conflicts with.
+
+        If the module file does not exist, both lists are empty. If it is
+        invalid, an error is issued and None is returned.
+        """
+        try:
+            st = os.stat(modfile)
+        except OSError:
+            return [], []
+        commands = self.get_commands(modfile, st)
+        if commands is None:
+            return None
+        return self.get_declarations(commands)
+
+    def get_includes(self, modfile):
+        """Return list of (path, modification time, size) tuples of all files
+        included by module file `modfile` (directly or indirectly), or None if
+        it does not exist or is invalid."""
+        try:
+            st = os.stat(modfile)
+        except OSError:
+            return None
+        if self.get_commands(modfile, st) is None:
+            return None
+        return self.resolved[(modfile, st.st_mtime, st.st_size)][1]
+
+    def get_declarations(self, commands):
+        """Return tuple with the list of modules required by compiled module
+        file `commands` and the list of modules it conflicts with."""
+        return ([args[0] for cmd, args in commands if cmd == 'requires'],
+                [args[0] for cmd, args in commands if cmd == 'conflicts'])
+
+    def get_commands(self, modfile, st):
+        """Return compiled module file `modfile` with all includes resolved
+        as a list of (command, arguments) tuples, or None if the file is
+        invalid.
+
+        `st` is the result of `os.stat()` for the module file. Each file is
+        only resolved once per parser.
+        """
+        key = (modfile, st.st_mtime, st.st_size)
+        if key not in self.resolved:
+            commands = self.get_file_commands(modfile, st)
+            if commands is not None:
+                self.resolving.append(modfile)
+                try:
+                    commands = self.resolve(modfile, commands)
+                finally:
+                    self.resolving.pop()
+            self.resolved[key] = commands
+        result = self.resolved[key]
+        return result[0] if result is not None else None
+
+    def resolve(self, modfile, commands):
+        """Return tuple with compiled module file `commands` of `modfile`
+        where includes are replaced by the commands of the included files, and
+        list of (path, modification time, size) tuples of all included files,
+        or None if an included file is missing, invalid or includes itself."""
+        resolved = []
+        includes = []
+        for cmd, args in commands:
+            # Keep all commands except includes
+            if cmd not in ['include', 'source']:
+                resolved.append((cmd, args))
+                continue
+
+            # Get included file relative to the including file
+            path = os.path.normpath(os.path.join(
+                    os.path.dirname(modfile), os.path.expanduser(args[0])))
+            if path in self.resolving:
+                self.be.error("Circular include of '{p}' in module file "
+                              "'{mf}'.".format(p=path, mf=modfile))
+                return None
+            try:
+                st = os.stat(path)
+            except OSError:
+                st = None
+            if st is None or not stat.S_ISREG(st.st_mode):
+                self.be.error("File '{p}' included in module file '{mf}' not "
+                              "found.".format(p=path, mf=modfile))
+                return None
+
+            # Add commands of included file (with its own includes resolved)
+            if self.get_commands(path, st) is None:
+                return None
+            included, nested = self.resolved[(path, st.st_mtime,
+                                              st.st_size)]
+            resolved.extend(included)
+            includes.append((path, st.st_mtime, st.st_size))
+            includes.extend([i for i in nested if i not in includes])
+
+        return resolved, includes
+
+    def get_file_commands(self, modfile, st):
+        """Return compiled module file `modfile` as a list of (command,
+        arguments) tuples without resolving includes, or None if the file is
+        invalid.
+
+        `st` is the result of `os.stat()` for the module file. Compiled module
+        files are reused as long as the modification time and size of the
+        module file are unchanged.
+        """
+        # Remember all module files that were used
+        self.files.add(modfile)
+
+        # Try compiled module files from this run
+        key = (modfile, st.st_mtime, st.st_size)
+        commands = self.compiled.get(key)
+        if commands is not None:
+            return commands
+
+        # Try compiled module files from the persistent cache
+        name = None
+        if self.cache:
+            import hashlib
+            name = os.path.join(self.cache_group, hashlib.sha1(
+                    modfile.encode('utf-8')).hexdigest())
+            data = self.cache.load(name)
+            if isinstance(data, dict) and (
+                    data.get('path') == modfile and
+                    data.get('mtime') == st.st_mtime and
+                    data.get('size') == st.st_size):
+                commands = [(cmd, tuple(args)) for cmd, args in
+                            data['commands']]
+                self.compiled.add(key, commands)
+                return commands
+
+        # Compile module file and store result
+        commands = self.compile(modfile)
+        if commands is None:
+            return None
+        self.compiled.add(key, commands)
+        if self.cache:
+            if self.cache.store(name, {'path': modfile, 'mtime': st.st_mtime,
+                                       'size': st.st_size,
+                                       'commands': commands}):
+                self.cache.prune(self.cache_group, self.cache_max_items,
+                                 self.cache_max_bytes)
+        return commands
+
+    def compile(self, modfile):
+        """Read module file `modfile` and return it as a list of (command,
+        arguments) tuples.
+
+        Unknown commands are skipped. If the file contains invalid syntax or
+        a command has the wrong number of arguments, an error is issued and
+        None is returned.
+        """
         # Read module file
         with open(modfile, 'r') as f:
             lines = f.readlines()
 
         # Try to parse each line into shell tokens or die
+        import shlex
         try:
             splitlines = [shlex.split(line) for line in lines]
         except Exception as e:
             self.be.error("Bad syntax in module file '{mf}': {e} ({n})".format(
                     mf=modfile, e=e, n=type(e).__name__))
-            return False
+            return None
 
-        # Parse each line indicidually
-        for tokens in splitlines:
+        # Check each line individually
+        commands = []
+        for n, tokens in enumerate(splitlines):
             # Skip line if there were no tokens
             if len(tokens) == 0:
                 continue
 
             # First token is command, rest (if existing) are arguments
             cmd = tokens[0]
-            args = tokens[1:]
+            args = tuple(tokens[1:])
 
-            # If command exists, execute it while providing the arguments from
-            # the file
-            if cmd in self.commands:
-                self.commands[cmd](*args)
-
-        # Return true to indicate that nothing was wrong
-        return True
+            # Skip unknown commands and check arguments of known commands
+            if cmd not in self.commands:
+                continue
+            if len(args) != self.nargs[cmd]:
+                self.be.error("Bad syntax in module file '{mf}' (line {n}): "
+                        "'{c}' expects {e} argument(s)".format(mf=modfile,
+                        n=n+1, c=cmd, e=self.nargs[cmd]))
+                return None
+            commands.append((cmd, args))
 
+        return commands
@@ -0,0 +1,373 @@
+#!/usr/bin/env python
+
+# Modm - Modules iMproved
+# Copyright (C) 2013-2014  Michael Schlottke
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+# System imports
+import os
+import stat
+import time
+
+class ModuleIndex:
+    """
+    Class to scan module directories and keep a persistent index of the scan
+    results.
+
+    For each directory in the modules path, the index stores the names of all
+    module folders found in it. For each module folder, it stores the names of
+    the module files and the information from the special files (default
+    version, help file, category). Each entry is validated against the
+    modification time of its directory, thus only directories that changed
+    since the last scan are read again.
+
+    Each directory entry and each module folder record is stored as a separate
+    cache item, which is only read when it is used and only written when it
+    changed. Thus looking up a few modules does not depend on the size of the
+    module tree.
+
+    Since editing a file in place does not change the modification time of
+    its module folder, the modification times of the files with the default
+    version and the category are stored and checked as well.
+
+    Directories are read with `os.scandir()` where available, which provides
+    the type of each entry without an additional `stat()` call. If many
+    directories changed, they can be scanned concurrently by a pool of
+    threads, which hides the latency of network file systems.
+    """
+
+    cache_name = 'index'
+
+    # Version of the index format (entries stored in another format are
+    # discarded)
+    format_version = 4
+
+    # Directories modified less than this many seconds before they were scanned
+    # are not trusted, since a later modification within the resolution of the
+    # file system timestamps would go unnoticed
+    mtime_resolution = 2.0
+
+    # Minimum number of directories to rescan for using a pool of threads
+    # (starting the threads costs more than scanning a few directories)
+    threads_min_items = 4
+
+    def __init__(self, cache=None, default_file='.default', help_file='.help',
+                 category_file='.category', threads=1):
+        """Save arguments and initialize member variables.
+
+        Arguments:
+          cache         -- object to store the index persistently (if None,
+                           nothing is stored)
+          default_file  -- name of file with the default module version
+          help_file     -- name of file with the module help
+          category_file -- name of file with the module category
+          threads       -- maximum number of threads to scan directories
+                           concurrently (1 means no threads are used)
+        """
+        # Save arguments
+        self.cache = cache
+        self.default_file = default_file
+        self.help_file = help_file
+        self.category_file = category_file
+        self.threads = threads
+
+        # Init other members (directory entries by directory, module records
+        # by directory and name, and the items that need to be stored)
+        self.directories = dict()
+        self.records = dict()
+        self.modified = set()
+
+    def get_item_name(self, kind, path):
+        """Return name of cache item of kind `kind` ('directories' or
+        'modules') for `path`."""
+        import hashlib
+        return os.path.join(self.cache_name, kind,
+                            hashlib.sha1(path.encode('utf-8')).hexdigest())
+
+    def load(self, kind, path):
+        """Return entry of kind `kind` for `path` from the cache, or None if
+        it is not stored."""
+        if not self.cache:
+            return None
+        data = self.cache.load(self.get_item_name(kind, path))
+        if isinstance(data, dict) and (
+                data.get('version') == self.format_version and
+                data.get('path') == path):
+            return data['entry']
+        return None
+
+    def save(self):
+        """Store all modified directory entries and module records in the
+        cache (records of module folders that no longer exist are
+        removed)."""
+        if self.cache:
+            for kind, key in self.modified:
+                if kind == 'directories':
+                    path, entry = key, self.directories[key]
+                else:
+                    path, entry = os.path.join(*key), self.records[key]
+                name = self.get_item_name(kind, path)
+                if entry is None:
+                    self.cache.remove(name)
+                else:
+                    self.cache.store(name, {'version': self.format_version,
+                                            'path': path, 'entry': entry})
+        self.modified = set()
+
+    def get_mtime(self, path):
+        """Return modification time of `path` or None if it does not exist."""
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return None
+
+    def stable_mtime(self, mtime):
+        """Return `mtime` if it can be used to validate an index entry later
+        on, otherwise None."""
+        if mtime is None or time.time() - mtime < self.mtime_resolution:
+            return None
+        return mtime
+
+    def get_directory(self, directory):
+        """Return index entry for `directory` (load or create it if
+        necessary)."""
+        if directory not in self.directories:
+            entry = self.load('directories', directory)
+            if entry is None:
+                entry = {'mtime': None, 'names': None}
+            self.directories[directory] = entry
+        return self.directories[directory]
+
+    def get_record(self, directory, name):
+        """Return index record for module folder `name` in `directory` as it
+        is stored, or None if there is none (cf. `get_module()`)."""
+        key = (directory, name)
+        if key not in self.records:
+            self.records[key] = self.load('modules',
+                                          os.path.join(directory, name))
+        return self.records[key]
+
+    def set_record(self, directory, name, record):
+        """Set index record for module folder `name` in `directory` to
+        `record` (None removes the record)."""
+        if record is None and self.get_record(directory, name) is None:
+            return
+        self.records[(directory, name)] = record
+        self.modified.add(('modules', (directory, name)))
+
+    def get_module_names(self, directory):
+        """Return names of all module folders in `directory`."""
+        entry = self.get_directory(directory)
+
+        # Rescan directory if it changed since the last scan
+        mtime = self.get_mtime(directory)
+        if self.is_outdated(entry, mtime):
+            self.update_directory(directory, mtime)
+        return entry['names']
+
+    def is_outdated(self, entry, mtime):
+        """Return true if index entry or record `entry` needs to be updated
+        for a directory with modification time `mtime`."""
+        return entry is None or mtime is None or entry['mtime'] != mtime
+
+    def is_module_outdated(self, record, modpath, mtime):
+        """Return true if `record` needs to be updated for module folder
+        `modpath` with modification time `mtime`, or if one of the special
+        files read for the record changed since (cf. `is_outdated()`)."""
+        if self.is_outdated(record, mtime):
+            return True
+        for f, fmtime in record['file_mtimes'].items():
+            if fmtime is None or (
+                    self.get_mtime(os.path.join(modpath, f)) != fmtime):
+                return True
+        return False
+
+    def update_directory(self, directory, mtime):
+        """Rescan `directory` with modification time `mtime` and update its
+        index entry."""
+        entry = self.get_directory(directory)
+        previous = entry['names'] or []
+        entry['names'] = self.scan_directory(directory)
+        entry['mtime'] = self.stable_mtime(mtime)
+        self.modified.add(('directories', directory))
+
+        # Forget about modules that no longer exist
+        names = set(entry['names'])
+        for name in [n for n in previous if n not in names]:
+            self.set_record(directory, name, None)
+
+    def get_module(self, directory, name):
+        """Return index record for module folder `name` in `directory`, or
+        None if no such folder exists.
+
+        The record is a dictionary with the names of the module files found
+        in natural sort order (`versions`) and their natural sort keys
+        (`version_keys`, cf. `natsort.natsort_key()`), the path to the default
+        module file (`default`), the path to the help file (`help_file`) and
+        the module category (`category`). Information that is not available
+        is set to None. The modification times of the special files that were
+        read are kept as well (`file_mtimes`).
+        """
+        # Rescan module folder if it changed since the last scan
+        modpath = os.path.join(directory, name)
+        mtime = self.get_mtime(modpath)
+        if self.is_module_outdated(self.get_record(directory, name), modpath,
+                                   mtime):
+            self.update_module(directory, name, mtime)
+        return self.get_record(directory, name)
+
+    def update_module(self, directory, name, mtime):
+        """Rescan module folder `name` in `directory` with modification time
+        `mtime` and update its index record (the record is removed if the
+        module folder does not exist)."""
+        modpath = os.path.join(directory, name)
+        if mtime is None or not os.path.isdir(modpath):
+            self.set_record(directory, name, None)
+            return
+        record = self.scan_module(modpath)
+        record['mtime'] = self.stable_mtime(mtime)
+        self.set_record(directory, name, record)
+
+    def get_modules(self, directories):
+        """Return list of (directory, name, record) tuples for all module
+        folders in `directories` (cf. `get_module()`).
+
+        The modification times are checked first, and only directories and
+        module folders that changed are scanned (concurrently, if there are
+        enough of them). The result is ordered by directory first.
+        """
+        # Create entries beforehand, since this modifies shared data
+        entries = [self.get_directory(d) for d in directories]
+
+        # Rescan directories that changed since the last scan
+        mtimes = [self.get_mtime(d) for d in directories]
+        self.map(lambda item: self.update_directory(*item),
+                 [(d, m) for d, e, m in zip(directories, entries, mtimes)
+                  if self.is_outdated(e, m)])
+
+        # Load records of all module folders (concurrently, if there are
+        # enough of them, since each is stored separately) and rescan module
+        # folders that changed since the last scan
+        folders = [(d, n) for d, e in zip(directories, entries)
+                   for n in e['names']]
+        self.map(lambda folder: self.get_record(*folder),
+                 [f for f in folders if f not in self.records])
+        mtimes = [self.get_mtime(os.path.join(d, n)) for d, n in folders]
+        self.map(lambda item: self.update_module(*item),
+                 [(d, n, m) for (d, n), m in zip(folders, mtimes)
+                  if self.is_module_outdated(self.records[(d, n)],
+                                             os.path.join(d, n), m)])
+
+        return [(d, n, self.records[(d, n)]) for d, n in folders]
+
+    def map(self, function, items):
+        """Return list of results of `function` for each item in `items`,
+        using a pool of threads if enabled and if there are enough items
+        (cf. `threads_min_items`)."""
+        if self.threads <= 1 or len(items) < max(self.threads_min_items, 2):
+            return [function(item) for item in items]
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(min(self.threads, len(items)))
+        try:
+            return pool.map(function, items)
+        finally:
+            pool.close()
+            pool.join()
+
+    def list_directory(self, directory):
+        """Return list of (name, is_dir, is_file) tuples for all entries in
+        `directory`. Symbolic links are followed."""
+        # Determine types from the directory entries if possible
+        if hasattr(os, 'scandir'):
+            entries = []
+            for entry in os.scandir(directory):
+                try:
+                    entries.append((entry.name, entry.is_dir(),
+                                    entry.is_file()))
+                except OSError:
+                    entries.append((entry.name, False, False))
+            return entries
+
+        # Otherwise query each entry
+        entries = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            try:
+                mode = os.stat(path).st_mode
+            except OSError:
+                entries.append((name, False, False))
+                continue
+            entries.append((name, stat.S_ISDIR(mode), stat.S_ISREG(mode)))
+        return entries
+
+    def scan_directory(self, directory):
+        """Return names of all module folders in `directory` (hidden folders
+        are skipped)."""
+        return [name for name, is_dir, _ in self.list_directory(directory)
+                if is_dir and not name.startswith('.')]
+
+    def scan_module(self, modpath):
+        """Read all module files and special files in module folder `modpath`
+        and return the corresponding index record."""
+        record = {'versions': [], 'default': None, 'help_file': None,
+                  'category': None, 'file_mtimes': dict()}
+
+        for f, _, is_file in self.list_directory(modpath):
+            if not is_file:
+                continue
+            modfile = os.path.join(modpath, f)
+
+            # Check if filename matches any of the special names
+            if f == self.default_file:
+                # Set default version (it is checked below whether the
+                # referenced file exists)
+                record['file_mtimes'][f] = self.stable_mtime(
+                        self.get_mtime(modfile))
+                with open(modfile, 'r') as fh:
+                    defaultversion = fh.readline().strip()
+                record['default'] = os.path.join(modpath, defaultversion)
+            elif f == self.help_file:
+                # Set help file
+                record['help_file'] = modfile
+            elif f == self.category_file:
+                # Set category
+                record['file_mtimes'][f] = self.stable_mtime(
+                        self.get_mtime(modfile))
+                with open(modfile, 'r') as fh:
+                    category = fh.readline().strip()
+                record['category'] = category if category else None
+            else:
+                # Add version file
+                record['versions'].append(f)
+
+        # Sort versions naturally and keep their sort keys for later use
+        from natsort import natsort_key
+        keys = [(natsort_key(v), v) for v in record['versions']]
+        keys.sort()
+        record['versions'] = [v for _, v in keys]
+        record['version_keys'] = [k for k, _ in keys]
+
+        # Only keep default version if the referenced file exists (version
+        # files are known to exist without querying the file system)
+        default = record['default']
+        if default is not None and not (
+                os.path.dirname(default) == modpath and
+                os.path.basename(default) in record['versions']) and (
+                not os.path.isfile(default)):
+            record['default'] = None
+
+        return record
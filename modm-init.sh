@@ -29,6 +29,11 @@ MODM_MODULES_PATH="/home/mic/.pool/modm-modules"
 # Set email address to show for internal error messages
 MODM_ADMIN_EMAIL="root@localhost"
 
+# Set path to socket of a running Modm server (optional, see modmserver.py;
+# if empty or if the server is not running, Modm is run directly). Since a
+# server only serves the user who started it, a socket set by the user is kept
+MODM_SERVER_SOCKET="${MODM_SERVER_SOCKET:-}"
+
 
 ################################################################################
 # NO NEED TO EDIT ANYTHING BEYOND THIS POINT
@@ -40,9 +45,13 @@ if [ "${BASH_SOURCE[0]}" = "$0" ]; then
   exit 2
 fi
 
-# Define function to call MODM and make it available to subshells
+# Define function to call MODM and make it available to subshells (the client
+# script is used as entry point since it starts faster than modm.py and runs
+# Modm directly if no server is available). Messages are written directly to
+# the terminal through file descriptor 3 as soon as they are available, while
+# the commands to modify the environment are eval'd at the end.
 modm() {
-  eval "`$MODM_PY $*`"
+  { eval "`MODM_DISPLAY_FD=3 ${MODM_PY%/*}/modmclient.py $* 3>&4`"; } 4>&1
 }
 
 # Export functions and Modm configuration values
@@ -50,6 +59,7 @@ export -f modm
 export MODM_PY
 export MODM_MODULES_PATH
 export MODM_ADMIN_EMAIL
+export MODM_SERVER_SOCKET
 
 # Enable bash autocomplete
 . $(dirname $MODM_PY)/autocomplete/bash
@@ -25,19 +25,32 @@ __version__ = '1.0+x'
 import sys
 import os
 
-# Project imports
+# Project imports (modules that are only needed by some commands, i.e.
+# `natsort` and `modfileparser`, are imported where they are used to keep the
+# startup time low)
 from basheval import BashEval
+from cache import Cache
 from env import Env
 from module import Module
-from natsort import natsorted
-from modfileparser import ModfileParser
+from modindex import ModuleIndex
 
 def main():
     """If this file is run as a script, `main()` will be executed.
 
-    Creates `Modm` instance and calls `run()` on it.
+    Creates `Modm` instance and calls `run()` on it. If the profiling
+    environment variable is set, the call is profiled (cf. `profiler`). If a
+    machine-readable output format is used, the exit status is 1 if an error
+    occurred.
     """
-    Modm(sys.argv).run()
+    modm = Modm(sys.argv)
+    if os.environ.get(Modm.profile_var):
+        from profiler import profile
+        profile(modm.run, Modm, os.environ[Modm.profile_var],
+                title=' '.join(sys.argv[1:]))
+    else:
+        modm.run()
+    if modm.output_format != 'bash' and modm.be.has_errors:
+        sys.exit(1)
 
 class Modm:
     """
@@ -53,46 +66,142 @@ class Modm:
     module_category_file = '.category'
     modules_path_var = 'MODM_MODULES_PATH'
     modules_loaded_var = 'MODM_LOADED_MODULES'
+    load_journal_var = 'MODM_LOAD_JOURNAL'
+    path_refs_var = 'MODM_PATH_REFS'
     admin_email_var = 'MODM_ADMIN_EMAIL'
     color_setting_var = 'MODM_USE_COLORS'
+    cache_dir_var = 'MODM_CACHE_DIR'
+    cache_setting_var = 'MODM_USE_CACHE'
+    eval_cache_setting_var = 'MODM_USE_EVAL_CACHE'
+    collections_dir_var = 'MODM_COLLECTIONS_DIR'
+    profile_var = 'MODM_PROFILE'
+    scan_threads_var = 'MODM_SCAN_THREADS'
+    display_fd_var = 'MODM_DISPLAY_FD'
+    output_format_var = 'MODM_OUTPUT_FORMAT'
     admin_default_email = 'root@localhost'
+    cache_default_dir = os.path.join('.cache', 'modm')
+    collections_default_dir = os.path.join('.modm', 'collections')
+    collection_default_name = 'default'
+    scan_threads_default = 8
     available_commands = ['avail', 'status', 'config', 'help', 'list', 'load',
-                          'unload']
-
-    def __init__(self, argv=['modm.py']):
+                          'purge', 'restore', 'save', 'switch', 'unload']
+    available_options = ['--batch', '--build-help-cache', '--help',
+                         '--version']
+    help_cache_group = 'help'
+    help_cache_max_items = 1000
+    help_cache_dir = '.cache'
+
+    def __init__(self, argv=['modm.py'], environ=None):
         """Save arguments and initialize member variables.
 
         Arguments:
-          argv -- should be called with `sys.argv`, otherwise a list with at
-                  least one item has to be provided
+          argv    -- should be called with `sys.argv`, otherwise a list with
+                     at least one item has to be provided
+          environ -- mapping with the environment variables to use (default:
+                     `os.environ`)
         """
         # Save arguments
         self.argv = argv
+        self.environ = os.environ if environ is None else environ
 
         # Disable use of colors if environment variable is set to 'off' value
-        if self.color_setting_var in os.environ and (
-                os.environ[self.color_setting_var].lower() in
+        if self.color_setting_var in self.environ and (
+                self.environ[self.color_setting_var].lower() in
                 ['no', 'off', 'false']):
             self.use_colors = False
         else:
             self.use_colors = True
 
-        # Create Bash evaluation instance
-        self.be = BashEval(self.use_colors)
+        # Write messages directly to the file descriptor from the environment
+        # variable if it is set and valid (so that output is streamed),
+        # otherwise include them in the command string
+        display = None
+        if self.display_fd_var in self.environ:
+            try:
+                display = os.fdopen(int(self.environ[self.display_fd_var]),
+                                    'w')
+            except (ValueError, OSError):
+                pass
+
+        # Create Bash evaluation instance, or an instance for machine-readable
+        # output if the environment variable is set to a supported format
+        # (messages are written to stderr if they are not part of the output)
+        self.output_format = self.environ.get(self.output_format_var,
+                                              'bash').lower()
+        if self.output_format in ['json', 'nul']:
+            from enveval import EnvEval
+            self.be = EnvEval(self.output_format, display=sys.stderr)
+        else:
+            self.output_format = 'bash'
+            self.be = BashEval(self.use_colors, display=display)
 
         # Set admin email address to environment variable if found, otherwise
         # to built-in default
-        if self.admin_email_var in os.environ:
-            self.admin_email = os.environ[self.admin_email_var]
+        if self.admin_email_var in self.environ:
+            self.admin_email = self.environ[self.admin_email_var]
         else:
             self.admin_email = self.admin_default_email
 
+        # Set cache directory to environment variable if found, otherwise to
+        # the per-user default (respecting the XDG base directory settings)
+        if self.cache_dir_var in self.environ:
+            self.cache_dir = self.environ[self.cache_dir_var]
+        elif 'XDG_CACHE_HOME' in self.environ:
+            self.cache_dir = os.path.join(self.environ['XDG_CACHE_HOME'],
+                                          'modm')
+        else:
+            self.cache_dir = os.path.join(self.environ.get('HOME',
+                    os.path.expanduser('~')), self.cache_default_dir)
+
+        # Set collections directory to environment variable if found,
+        # otherwise to the per-user default
+        if self.collections_dir_var in self.environ:
+            self.collections_dir = self.environ[self.collections_dir_var]
+        else:
+            self.collections_dir = os.path.join(self.environ.get('HOME',
+                    os.path.expanduser('~')), self.collections_default_dir)
+
+        # Disable use of cache if environment variable is set to 'off' value
+        if self.cache_setting_var in self.environ and (
+                self.environ[self.cache_setting_var].lower() in
+                ['no', 'off', 'false']):
+            self.use_cache = False
+        else:
+            self.use_cache = True
+
+        # Disable reuse of command strings if the cache is disabled, if output
+        # is not for Bash or if environment variable is set to 'off' value
+        if not self.use_cache or self.output_format != 'bash' or (
+                self.eval_cache_setting_var in self.environ and
+                self.environ[self.eval_cache_setting_var].lower() in
+                ['no', 'off', 'false']):
+            self.use_eval_cache = False
+        else:
+            self.use_eval_cache = True
+
+        # Set maximum number of threads to scan module directories to
+        # environment variable if found and valid, otherwise to the default
+        try:
+            self.scan_threads = max(1, int(
+                    self.environ[self.scan_threads_var]))
+        except (KeyError, ValueError):
+            self.scan_threads = self.scan_threads_default
+
         # Init other members
         self.cmd = None
         self.args = []
         self.env = None
         self.modules = []
+        self.module_map = dict()
+        self.discovered = set()
         self.parser = None
+        self.compiled = None
+        self.cache = Cache(self.cache_dir) if self.use_cache else None
+        self.index = ModuleIndex(self.cache,
+                                 default_file=self.module_default_file,
+                                 help_file=self.module_help_file,
+                                 category_file=self.module_category_file,
+                                 threads=self.scan_threads)
 
         # Set init variables to False
         self.is_init_argv = False
@@ -100,9 +209,14 @@ class Modm:
         self.is_init_modules = False
         self.is_init_parser = False
 
-    def run(self):
+        # Commands are not run in batch mode by default
+        self.is_batch = False
+
+    def run(self, stream=None):
         """Call `runsafe()` in try-except block to catch irregular errors and
-        print command string from BashEval."""
+        print command string from BashEval to `stream` (default: stdout)."""
+        if stream is None:
+            stream = sys.stdout
         try:
             self.rununsafe()
         except Exception as e:
@@ -113,13 +227,19 @@ class Modm:
                     .format(e=self.admin_email), internal=True)
             raise
         finally:
-            sys.stdout.write(self.be.cmdstring())
+            self.be.flush()
+            stream.write(self.be.cmdstring())
 
     def rununsafe(self):
         """Parse command line arguments and execute specified command."""
         # Init command line arguments
         self.init_argv()
 
+        # Execute command
+        self.run_command()
+
+    def run_command(self):
+        """Execute command `self.cmd` with arguments `self.args`."""
         # Parse command for alternatives
         command, alternatives = self.parse_command(self.cmd)
 
@@ -128,6 +248,10 @@ class Modm:
             self.cmd_help()
         elif command in ['--version']:
             self.cmd_version()
+        elif command in ['--build-help-cache']:
+            self.cmd_build_help_cache()
+        elif command in ['--batch']:
+            self.cmd_batch()
         elif command in ['avail', 'status']:
             self.cmd_avail()
         elif command in ['config']:
@@ -135,9 +259,17 @@ class Modm:
         elif command in ['list']:
             self.cmd_list()
         elif command in ['load']:
-            self.cmd_load()
+            self.run_cached(command, self.cmd_load)
+        elif command in ['purge']:
+            self.run_cached(command, self.cmd_purge)
+        elif command in ['restore']:
+            self.cmd_restore()
+        elif command in ['save']:
+            self.cmd_save()
+        elif command in ['switch']:
+            self.run_cached(command, self.cmd_switch)
         elif command in ['unload']:
-            self.cmd_unload()
+            self.run_cached(command, self.cmd_unload)
         elif command is None and alternatives is None:
             # If no command was given, show usage information
             self.be.error("No command given.")
@@ -158,6 +290,71 @@ class Modm:
                     t=arg_type, c=self.cmd))
             self.print_help('usage')
 
+    def run_cached(self, command, method):
+        """Execute `method` for `command`, but reuse the command string of an
+        earlier identical call if none of its inputs changed since (cf.
+        `EvalCache`)."""
+        if not self.use_eval_cache:
+            method()
+            return
+
+        # Messages need to be part of the command string to be stored, thus
+        # they are not written to the display (output of these commands is
+        # short anyway)
+        self.be.flush()
+        self.be.display = None
+
+        # Use stored command string if available
+        from evalcache import EvalCache
+        evalcache = EvalCache(self.cache)
+        key = self.get_eval_key(command)
+        output = evalcache.load(key, self.environ)
+        if output is not None:
+            self.be.execute(output)
+            return
+
+        # Otherwise execute command and store the result if it was successful
+        method()
+        if not self.be.has_errors:
+            evalcache.store(key, self.get_eval_environ(),
+                            self.get_eval_paths(), self.be.peek())
+
+    def get_eval_key(self, command):
+        """Return key that describes a call to `command` for `EvalCache`."""
+        key = [command, self.args, self.use_colors,
+               self.environ.get(self.modules_path_var),
+               self.environ.get(self.modules_loaded_var),
+               self.environ.get(self.load_journal_var),
+               self.environ.get(self.path_refs_var)]
+
+        # Relative module paths depend on the working directory
+        self.init_env()
+        if not all([os.path.isabs(p) for p in self.env.modpath]):
+            key.append(os.getcwd())
+        return key
+
+    def get_eval_environ(self):
+        """Return initial values of all environment variables that were used
+        by module files."""
+        return dict([(name, self.environ.get(name))
+                     for name in self.env.variables])
+
+    def get_eval_paths(self):
+        """Return all module folders and module files that were read,
+        including the special files of the module folders that may be edited
+        in place."""
+        paths = []
+        for d in self.env.modpath:
+            for n in sorted(self.discovered):
+                modpath = os.path.join(d, n)
+                paths.extend([modpath,
+                              os.path.join(modpath, self.module_default_file),
+                              os.path.join(modpath,
+                                           self.module_category_file)])
+        if self.parser is not None:
+            paths.extend(sorted(self.parser.files))
+        return paths
+
     def init_argv(self):
         """Initialize command line arguments if not yet done."""
         if not self.is_init_argv:
@@ -172,107 +369,153 @@ class Modm:
         """Initialize environment handler if not yet done."""
         if not self.is_init_env:
             self.env = Env(modpath_var=self.modules_path_var,
-                           modloaded_var=self.modules_loaded_var)
+                           modloaded_var=self.modules_loaded_var,
+                           journal_var=self.load_journal_var,
+                           path_refs_var=self.path_refs_var,
+                           environ=self.environ)
             self.is_init_env = True
 
-    def init_modules(self):
+    def init_modules(self, names=None):
         """Initialize all modules if not yet done.
 
         Check all module paths for all available modules and their versions,
         defaults, categories etc. For a module with a given name, the first
         module found in the modules path overrides the settings for all later
         modules. However, it is possible that later versions are appended.
+
+        If a list of module `names` is given, only the module folders with
+        these names are checked in each module path (a version in the name is
+        ignored). The resulting modules are the same as if all modules had
+        been initialized, but the module list used for display is not set up.
         """
         # Only initialize if not yet done
-        if not self.is_init_modules:
-            self.init_env()
+        if self.is_init_modules:
+            return
+        self.init_env()
+
+        # If names were given, only initialize the requested modules
+        if names is not None:
+            for name in names:
+                modname, _ = self.decode_name(name)
+
+                # Skip modules that were already checked as well as names
+                # that cannot be module folders
+                if (modname in self.discovered or modname.startswith('.') or
+                        os.path.sep in modname):
+                    continue
+                self.discovered.add(modname)
+
+                # Check the module folder in all module directories
+                for modules_directory in self.env.modpath:
+                    self.add_module(modules_directory, modname,
+                                    self.index.get_module(modules_directory,
+                                                          modname))
+
+                # Finalize module or delete it if no module files were found
+                module = self.module_map.get(modname)
+                if module is not None:
+                    if len(module.versions) > 0:
+                        self.finalize_module(module)
+                    else:
+                        del self.module_map[modname]
+
+            # Store updated index for the next call
+            self.index.save()
+            return
+
+        # Get all modules in all module directories from the index (modules
+        # that were initialized individually before are started over). The
+        # records are added in the order of the module directories, even
+        # though the directories may have been scanned concurrently.
+        self.module_map = dict()
+        for modules_directory, name, record in self.index.get_modules(
+                self.env.modpath):
+            self.add_module(modules_directory, name, record)
+
+        # Store updated index for the next call
+        self.index.save()
+
+        # Delete modules without versions (i.e. without module files)
+        for name in [n for n, m in self.module_map.items()
+                     if len(m.versions) == 0]:
+            del self.module_map[name]
+
+        # Sort modules
+        self.modules = sorted(self.module_map.values(),
+                              key=lambda m: m.sort_key)
+
+        # Sort versions and set default versions
+        for module in self.modules:
+            self.finalize_module(module)
+
+        # Set initialized state
+        self.is_init_modules = True
+
+    def finalize_module(self, module):
+        """Sort versions of `module` and set the default module file if none
+        was set explicitly."""
+        # Sort versions
+        module.versions.sort(key=lambda v: module.version_keys[v])
+
+        # Set default module to the highest version if none was set
+        if module.default is None:
+            module.default = module.versions[-1]
+
+    def add_module(self, modules_directory, name, record):
+        """Add module `name` from `modules_directory` to the list of modules.
+
+        `record` is the index record of the module folder (cf.
+        `ModuleIndex.get_module()`). Settings from earlier module directories
+        take precedence, but new versions are appended.
+        """
+        # Skip module folders that vanished while scanning or do not exist
+        if record is None:
+            return
 
-            # Iterate over directories containing the modules
-            for modules_directory in self.env.modpath:
-                # Iterate over module folders but skip hidden folders
-                for name in [d for d in os.listdir(modules_directory) if
-                        os.path.isdir(os.path.join(modules_directory, d)) and
-                        not d.startswith('.')]:
-                    # Get module index (if existing)
-                    index = self.find_module(name)
-
-                    # If module does not yet exist, create a new one
-                    if index == None:
-                        self.modules.append(Module())
-                        index = len(self.modules) - 1
-
-                    # Set module name if not yet set
-                    if self.modules[index].name is None:
-                        self.modules[index].name = name
-
-                    # Set module versions
-                    modpath = os.path.join(modules_directory, name)
-                    for modfile in [os.path.join(modpath, f) for f in
-                            os.listdir(modpath) if
-                            os.path.isfile(os.path.join(modpath, f))]:
-                        _, modversion = self.decode_file(modfile)
-
-                        # Check if filename matches any of the special names
-                        if modversion == self.module_default_file:
-                            # Set default version
-                            if self.modules[index].default is None:
-                                defaultversion = ''
-                                with open(modfile, 'r') as f:
-                                    defaultversion = f.readline().strip()
-                                defaultversionfile = os.path.join(modpath,
-                                        defaultversion)
-                                if os.path.isfile(defaultversionfile):
-                                    self.modules[index].default = (
-                                            defaultversionfile)
-                        elif modversion == self.module_help_file:
-                            # Set help file
-                            if self.modules[index].help_file is None:
-                                self.modules[index].help_file = (
-                                        os.path.join(modpath,
-                                        self.module_help_file))
-                        elif modversion == self.module_category_file:
-                            # Set category
-                            if self.modules[index].category is None:
-                                with open(modfile, 'r') as f:
-                                    category = f.readline().strip()
-                                    self.modules[index].category = (
-                                            category if category else None)
-                        else:
-                            # Add version file
-                            if modversion not in [
-                                    os.path.basename(v)
-                                    for v in self.modules[index].versions]:
-                                self.modules[index].versions.append(modfile)
-                            # Set loaded
-                            if modfile in self.env.modloaded:
-                                self.modules[index].loaded = modfile
-
-            # Delete modules without versions (i.e. without module files)
-            self.modules = [m for m in self.modules if len(m.versions) > 0]
-
-            # Sort modules
-            self.modules = natsorted(self.modules, key=lambda m: m.name)
-
-            # Sort versions
-            for i in range(len(self.modules)):
-                self.modules[i].versions = natsorted(self.modules[i].versions,
-                        key=lambda v: os.path.basename(v))
-
-            # Set default modules for modules that do not have one
-            for i in range(len(self.modules)):
-                if self.modules[i].default is None:
-                    self.modules[i].default = self.modules[i].versions[-1]
-
-            # Set initialized state
-            self.is_init_modules = True
+        # Get module (if existing)
+        module = self.find_module(name)
+
+        # If module does not yet exist, create a new one
+        if module is None:
+            module = Module()
+            self.module_map[name] = module
+
+        # Set module name and its sort key if not yet set
+        if module.name is None:
+            from natsort import natsort_key
+            module.name = name
+            module.sort_key = natsort_key(name)
+
+        # Set default version, help file and category if not yet set
+        if module.default is None:
+            module.default = record['default']
+        if module.help_file is None:
+            module.help_file = record['help_file']
+        if module.category is None:
+            module.category = record['category']
+
+        # Set module versions
+        modpath = os.path.join(modules_directory, name)
+        for modversion, sort_key in zip(record['versions'],
+                                        record['version_keys']):
+            modfile = os.path.join(modpath, modversion)
+
+            # Add version file
+            module.add_version(modfile, sort_key)
+            # Set loaded
+            if modfile in self.env.modloaded:
+                module.loaded = modfile
 
     def init_parser(self):
         """Initialize module filer parser if not yet done."""
         if not self.is_init_parser:
-            self.parser = ModfileParser(self.env, self.be)
+            from modfileparser import ModfileParser
+            self.parser = ModfileParser(self.env, self.be, cache=self.cache,
+                                        compiled=self.compiled)
+            self.is_init_parser = True
 
     def find_module(self, name, strict=False):
-        """Return the index of a module with name `name`.
+        """Return the module with name `name`.
 
         If no module was found with this name, return None. By default only the
         module name is checked, however, if `name` contains a version number and
@@ -281,23 +524,23 @@ class Modm:
         # Get name, version
         modname, modversion = self.decode_name(name)
 
-        # Check all modules for the name (and possibly version)
-        for i, module in enumerate(self.modules):
-            if module.name == modname:
-                if strict and modversion is not None and (modversion not in
-                        map(os.path.basename, module.versions)):
-                    return None
-                else:
-                    return i
-        return None
+        # Look up module by name (and possibly version)
+        module = self.module_map.get(modname)
+        if module is None:
+            return None
+        elif strict and modversion is not None and (
+                not module.has_version(modversion)):
+            return None
+        else:
+            return module
 
     def get_module_file(self, name):
         """Get a module file from the name. If no version is specified, return
         default module.
         """
-        # Get module index
-        i = self.find_module(name)
-        if i is None:
+        # Get module
+        module = self.find_module(name)
+        if module is None:
             return None
         else:
             # If module was found, decode name
@@ -305,12 +548,10 @@ class Modm:
 
             # Return default if no module version was found
             if not modversion:
-                return self.modules[i].default
+                return module.default
             # Otherwise return module file
             else:
-                modules = [modfile for modfile in self.modules[i].versions if
-                        os.path.basename(modfile) == modversion]
-                return modules[0] if len(modules) > 0 else None
+                return module.get_version_file(modversion)
 
     def decode_file(self, modfile):
         """Split a module file path into its module name and version
@@ -335,6 +576,10 @@ class Modm:
         if cmd is None:
             return None, None
 
+        # Options need to be given in full
+        if cmd.startswith('-'):
+            return (cmd, []) if cmd in self.available_options else (None, [])
+
         # Get list of matching commands
         commands = [c for c in self.available_commands if c.startswith(cmd)]
 
@@ -355,21 +600,91 @@ class Modm:
         with open(path, 'r') as f:
             self.be.echo(f.read(), newline=False, kind=kind, width=2048)
 
+    def print_help_file(self, path):
+        """Print help file at `path` using BashEval. The rendered contents are
+        taken from the help cache if possible (cf. `get_rendered_help()`).
+        Return False if the file could not be read, else True."""
+        text = self.get_rendered_help(path)
+        if text is None:
+            return False
+        self.be.echo_rendered(text)
+        return True
+
+    def get_doc_dir(self):
+        """Return path to directory with the built-in help files."""
+        return os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                            Modm.help_file_dir)
+
+    def get_rendered_help(self, path):
+        """Return contents of help file `path` as rendered by BashEval, or
+        None if the file could not be read.
+
+        Rendered help files are looked up in the help cache built at install
+        time (only for the built-in help files, cf. `cmd_build_help_cache()`)
+        and in the per-user cache. They are valid as long as the modification
+        time and size of the help file are unchanged. If no valid entry is
+        found, the help file is rendered and stored in the per-user cache.
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        kind = 'colors' if self.use_colors else 'plain'
+
+        # Look up rendered help file in all caches
+        name = self.get_help_cache_name(path)
+        caches = [self.cache] if self.cache else []
+        if path.startswith(self.get_doc_dir() + os.path.sep):
+            caches.insert(0, Cache(os.path.join(self.get_doc_dir(),
+                                                self.help_cache_dir)))
+        for cache in caches:
+            data = cache.load(name)
+            if isinstance(data, dict) and (data.get('path') == path and
+                                           data.get('mtime') == st.st_mtime and
+                                           data.get('size') == st.st_size):
+                return data[kind]
+
+        # Render help file and store it
+        data = self.render_help(path, st)
+        if data is None:
+            return None
+        if self.cache and self.cache.store(name, data):
+            self.cache.prune(self.help_cache_group, self.help_cache_max_items)
+        return data[kind]
+
+    def get_help_cache_name(self, path):
+        """Return name of the cache item for help file `path`."""
+        import hashlib
+        return os.path.join(self.help_cache_group,
+                            hashlib.sha1(path.encode('utf-8')).hexdigest())
+
+    def render_help(self, path, st):
+        """Return dictionary with the contents of help file `path` rendered
+        with (`colors`) and without (`plain`) colors, together with the
+        modification time and size from `st`, or None if it could not be
+        read."""
+        try:
+            with open(path, 'r') as f:
+                content = f.read()
+        except (IOError, OSError):
+            return None
+        return {'path': path, 'mtime': st.st_mtime, 'size': st.st_size,
+                'colors': BashEval(True).render(content, newline=False,
+                                                width=2048),
+                'plain': BashEval(False).render(content, newline=False,
+                                                width=2048)}
+
     def print_help(self, topic):
         """Print help file associated with `topic`. Issues error message if
         topic was not found."""
-        # Get help file path as combination of modm.py file path and topic
+        # Get help file path as combination of the help directory and topic
         # plus help file extension
-        help_file = os.path.join(os.path.dirname(os.path.realpath(__file__)),
-                                 Modm.help_file_dir,
+        help_file = os.path.join(self.get_doc_dir(),
                                  topic + Modm.help_file_suffix)
 
-        # If file exists, print its contents
-        if os.path.isfile(help_file):
-            self.print_file(help_file)
-        # Otherwise print error message. Since this should never happen, it is
-        # an internal error
-        else:
+        # If file exists, print its contents. Otherwise print error message.
+        # Since this should never happen, it is an internal error
+        if not self.print_help_file(help_file):
             self.be.error("Help file '{f}' not found.".format(f=help_file),
                           internal=True)
             self.be.error("Please send an email with the command you used and "
@@ -378,22 +693,28 @@ class Modm:
 
     def print_modules(self, modules):
         """All modules in list `modules`, sorted by category."""
-        # Determine all categories and the maximum string length of the modules
+        # Group modules by category (keeping their order) and determine the
+        # maximum string length of the modules
         maxlength = 0
-        categories = set()
+        groups = dict()
         for module in modules:
             maxlength = max(maxlength, len(module.name))
-            categories.add(module.category.strip().upper()
-                           if module.category else None)
+            category = (module.category.strip().upper()
+                        if module.category else None)
+            if category in groups:
+                groups[category].append(module)
+            else:
+                groups[category] = [module]
 
         # Natsort categories and put 'None' at the end if present
-        if None in categories:
-            categories = natsorted([c for c in categories if c is not None])
+        from natsort import natsort_key
+        categories = sorted([c for c in groups if c is not None],
+                            key=natsort_key)
+        if None in groups:
             categories.append(None)
-        else:
-            categories = natsorted(list(categories))
 
         # Print modules by category
+        loaded = set(self.env.modloaded)
         first = True
         for category in categories:
             # For the first category, no newline is needed
@@ -406,18 +727,14 @@ class Modm:
             self.be.echo(category if category else '<UNCATEGORIZED>')
 
             # Print each module in category
-            for module in [m for m in modules if (
-                    (True if category is None else False) if (
-                        m.category is None) else (
-                    m.category.strip().upper() == category))]:
-
+            for module in groups[category]:
                 # Get all versions of module
                 versions = []
                 for version in module.versions:
                     v = os.path.basename(version)
                     if version == module.default:
                         v = v + '(default)'
-                    if version in self.env.modloaded:
+                    if version in loaded:
                         v = self.be.highlight(v + '*', kind='info')
                     versions.append(v)
 
@@ -427,6 +744,10 @@ class Modm:
                 self.be.echo('  {m:{l}} {v}'.format(m=module.name+':',
                              l=maxlength+1, v=', '.join(versions)))
 
+            # Show each category as soon as it is complete (if messages are
+            # written to the display directly)
+            self.be.flush()
+
     def is_loaded(self, name):
         """Return True if module `name` is loaded, else False."""
         modname, _ = self.decode_name(name)
@@ -453,6 +774,25 @@ class Modm:
         else:
             if self.parser.load(modfile):
                 self.env.add_loaded_module(modfile)
+                self.record_journal(modfile, self.parser.last_commands)
+
+    def record_journal(self, modfile, commands):
+        """Record compiled module file `commands` that were executed to load
+        `modfile` in the load journal, so that the module can be unloaded
+        without reading its module file. Commands without effect on unloading
+        are omitted."""
+        self.env.set_journal_entry(modfile, [(cmd, args) for cmd, args in
+                                             commands if cmd != 'print_load'])
+
+    def get_dependencies(self, modfile):
+        """Return tuple with the list of modules required by module file
+        `modfile` and the list of modules it conflicts with, taken from the
+        load journal if the module is loaded (cf.
+        `ModfileParser.get_dependencies()`)."""
+        commands = self.env.get_journal_entry(modfile, self.parser.nargs)
+        if commands is not None:
+            return self.parser.get_declarations(commands)
+        return self.parser.get_dependencies(modfile)
 
     def unload_module(self, name):
         """Unload module `name` if it is currently loaded."""
@@ -467,16 +807,85 @@ class Modm:
             # list of loaded modules
             if modname == modnamefile and (
                     modversion is None or modversion == modversionfile):
-                if self.parser.unload(modfile):
-                    self.env.modloaded.remove(modfile)
+                # Undo the commands from the load journal if available,
+                # otherwise parse module file for unloading
+                commands = self.env.get_journal_entry(modfile,
+                                                      self.parser.nargs)
+                if commands is not None:
+                    self.parser.replay(commands, unload=True)
+                elif not self.parser.unload(modfile):
+                    continue
+                self.env.remove_loaded_module(modfile)
+                self.env.remove_journal_entry(modfile)
+
+    def load_modules(self, names):
+        """Load modules `names` together with all modules they require."""
+        # Resolve requirements and conflicts of all modules at once (errors
+        # are printed for modules that cannot be loaded) and load modules in
+        # the resulting order
+        from resolver import DependencyResolver
+        for name in DependencyResolver(self).resolve_load(names):
+            # If a version of the module is currently loaded, unload it
+            if self.is_loaded(name):
+                self.unload_module(self.decode_name(name)[0])
+            self.load_module(name)
+
+    def unload_all(self):
+        """Unload all loaded modules in reverse order of loading."""
+        for modfile in reversed(list(self.env.modloaded)):
+            self.unload_module(os.path.join(*self.decode_file(modfile)))
+
+    def is_collection_name(self, name):
+        """Return True if `name` can be used as a collection name, else print
+        an error and return False."""
+        if name and not name.startswith('.') and os.path.sep not in name:
+            return True
+        self.be.error("Invalid collection name '{c}'.".format(c=name))
+        return False
+
+    def save_collection(self, name):
+        """Save loaded modules together with their compiled module files as
+        collection `name`. Return True if successful."""
+        # Compile all loaded module files in the order in which they were
+        # loaded
+        modules = []
+        for modfile in self.env.modloaded:
+            compiled = self.parser.get_compiled(modfile)
+            if compiled is None:
+                self.be.error("Module file '{f}' could not be read.".format(
+                        f=modfile))
+                return False
+            mtime, size, commands = compiled
+            modules.append({'file': modfile, 'mtime': mtime, 'size': size,
+                            'commands': commands,
+                            'includes': self.parser.get_includes(modfile)})
+
+        # Store collection
+        if not Cache(self.collections_dir).store(name, {'modules': modules}):
+            self.be.error("Collection '{c}' could not be saved in '{d}'."
+                          .format(c=name, d=self.collections_dir))
+            return False
+        return True
+
+    def is_unchanged(self, modfile, mtime, size):
+        """Return True if module file `modfile` still has modification time
+        `mtime` and size `size`, else False."""
+        try:
+            st = os.stat(modfile)
+        except OSError:
+            return False
+        return st.st_mtime == mtime and st.st_size == size
 
     def process_modified(self):
         """Check all modified environment variables and unset/export them as
         needed.
+
+        Only the net changes are emitted, i.e. variables that end up with the
+        value they had in the environment are skipped.
         """
         # Iterate over all variables that were modified
         for var in [var for var in self.env.variables.values()
-                if var.is_modified()]:
+                if var.is_modified() and var.is_changed()]:
             # Unset variable if it is marked for unset
             if var.is_unset():
                 self.be.unset(var.get_name())
@@ -484,6 +893,45 @@ class Modm:
             else:
                 self.be.export(*var.get_export())
 
+    def export_env(self):
+        """Unset/export all modified environment variables as well as the
+        loaded modules. In batch mode, this is deferred until all commands
+        were executed."""
+        if self.is_batch:
+            return
+        self.process_modified()
+
+        # Loaded modules are always part of machine-readable output, and an
+        # unset variable is not exported only to become empty
+        modloaded = self.env.get_modloaded_str()
+        if not modloaded and self.env.modloaded_var not in self.environ:
+            modloaded = None
+        self.export_value(self.env.modloaded_var, modloaded,
+                          force=self.output_format != 'bash')
+
+        # Update reference counts of path entries if they were used (they are
+        # removed once empty)
+        path_refs = self.env.get_path_refs_str()
+        if path_refs is not None:
+            self.export_value(self.env.path_refs_var, path_refs or None)
+
+        # Update load journal if it changed (it is removed once empty)
+        if self.env.is_journal_modified:
+            self.export_value(self.env.journal_var,
+                              self.env.get_journal_str() or None)
+            self.env.is_journal_modified = False
+
+    def export_value(self, name, value, force=False):
+        """Export environment variable `name` with `value`, or unset it if
+        `value` is None, unless it already has this value and `force` is
+        false."""
+        if self.environ.get(name) == value and not force:
+            return
+        if value is None:
+            self.be.unset(name)
+        else:
+            self.be.export(name, value)
+
     def cmd_avail(self):
         """Command 'avail': list all available modules by category."""
         self.init_env()
@@ -498,7 +946,7 @@ class Modm:
 
             self.be.echo("Modm executable script path variable: MODM_PY")
             self.be.echo("Current script path: ", newline=False)
-            self.be.echo(os.environ['MODM_PY'], kind='info')
+            self.be.echo(self.environ['MODM_PY'], kind='info')
             self.be.echo()
             self.be.echo("Module path variable: {v}".format(
                     v=self.modules_path_var))
@@ -523,18 +971,61 @@ class Modm:
             self.be.echo("ON" if self.use_colors else "OFF", kind='info')
             self.be.echo("(if variable is set to 'OFF', colors are disabled, "
                          + "otherwise enabled)")
+            self.be.echo()
+            self.be.echo("Cache directory variable: {v}".format(
+                    v=self.cache_dir_var))
+            self.be.echo("Current cache directory: ", newline=False)
+            self.be.echo(self.cache_dir, kind='info')
+            self.be.echo()
+            self.be.echo("Cache settings variable: {v}".format(
+                    v=self.cache_setting_var))
+            self.be.echo("Current setting for cache usage: ", newline=False)
+            self.be.echo("ON" if self.use_cache else "OFF", kind='info')
+            self.be.echo("(if variable is set to 'OFF', the module index is "
+                         + "rebuilt on each call, otherwise it is cached)")
+            self.be.echo()
+            self.be.echo("Command cache settings variable: {v}".format(
+                    v=self.eval_cache_setting_var))
+            self.be.echo("Current setting for command cache usage: ",
+                         newline=False)
+            self.be.echo("ON" if self.use_eval_cache else "OFF", kind='info')
+            self.be.echo("(if variable is set to 'OFF', the output of 'load' "
+                         + "and 'unload' is never reused, otherwise it is "
+                         + "reused as long as the environment and the module "
+                         + "files are unchanged)")
+            self.be.echo()
+            self.be.echo("Collections directory variable: {v}".format(
+                    v=self.collections_dir_var))
+            self.be.echo("Current collections directory: ", newline=False)
+            self.be.echo(self.collections_dir, kind='info')
+            self.be.echo()
+            self.be.echo("Output format variable: {v}".format(
+                    v=self.output_format_var))
+            self.be.echo("Current output format: ", newline=False)
+            self.be.echo(self.output_format.upper(), kind='info')
+            self.be.echo("(if variable is set to 'JSON' or 'NUL', the "
+                         + "modifications of the environment are printed in a "
+                         + "machine-readable format instead of as Bash "
+                         + "commands)")
+            self.be.echo()
+            self.be.echo("Scan threads variable: {v}".format(
+                    v=self.scan_threads_var))
+            self.be.echo("Current number of scan threads: ", newline=False)
+            self.be.echo(self.scan_threads, kind='info')
+            self.be.echo("(maximum number of module directories that are "
+                         + "scanned concurrently, 1 disables threads)")
 
         # Otherwise show configuration for module and ignore further arguments
         else:
-            self.init_modules()
             name = self.args[0]
+            self.init_modules([name])
             modfile = self.get_module_file(name)
             # If module file was not found, print error
             if modfile is None:
                 self.be.error("Module '{m}' not found.".format(m=name))
             # Otherwise parse module file for configuration information
             else:
-                module = self.modules[self.find_module(name)]
+                module = self.find_module(name)
 
                 self.be.echo("Module name: ", newline=False)
                 self.be.echo(module.name, kind='info')
@@ -575,6 +1066,14 @@ class Modm:
             self.print_help(os.path.join('commands', 'list'))
         elif command in ['load']:
             self.print_help(os.path.join('commands', 'load'))
+        elif command in ['purge']:
+            self.print_help(os.path.join('commands', 'purge'))
+        elif command in ['restore']:
+            self.print_help(os.path.join('commands', 'restore'))
+        elif command in ['save']:
+            self.print_help(os.path.join('commands', 'save'))
+        elif command in ['switch']:
+            self.print_help(os.path.join('commands', 'switch'))
         elif command in ['unload']:
             self.print_help(os.path.join('commands', 'unload'))
         # If no command was determined but there are alternatives, show a list
@@ -589,26 +1088,28 @@ class Modm:
                     u=a[0:len(self.cmd)+1], t=a[len(self.cmd)+1:]))
         # Otherwise, check modules for help
         else:
-            self.init_modules()
-            index = self.find_module(topic)
+            self.init_modules([topic])
+            module = self.find_module(topic)
 
             # If no module was found with the name `topic`, show error
-            if index is None:
+            if module is None:
                 self.be.error("Unknown help topic '{t}'.".format(t=topic))
                 self.be.error("See 'modm help help' for a list of help topics.")
             # Otherwise show error if no help file was set for the module
-            elif self.modules[index].help_file is None:
+            elif module.help_file is None:
                 self.be.error("No help available for module '{m}'.".format(
-                    m=self.modules[index].name))
+                    m=module.name))
             # Otherwise (help file was found for module), print help file
-            else:
-                self.print_file(self.modules[index].help_file)
+            elif not self.print_help_file(module.help_file):
+                self.be.error("Help file '{f}' could not be read.".format(
+                    f=module.help_file))
 
     def cmd_list(self):
         """Command 'list': show all currently loaded modules."""
-        self.init_modules()
+        self.init_env()
 
         # Print all loaded modules in an easily parsable list
+        from natsort import natsorted
         for modfile in natsorted(self.env.modloaded):
             head, modversion = os.path.split(modfile)
             _, modname = os.path.split(head)
@@ -616,40 +1117,264 @@ class Modm:
 
     def cmd_load(self):
         """Command 'load': load all specified module files."""
-        self.init_modules()
+        self.init_modules(self.args)
         self.init_parser()
 
-        # Try to load each argument as a module
-        for name in self.args:
-            index = self.find_module(name, strict=True)
-            # If module was found, load it
-            if index is not None:
-                # If a version of the module is currently loaded, unload it
-                if self.is_loaded(name):
-                    self.unload_module(self.decode_name(name)[0])
-                self.load_module(name)
-            # Otherwise print error
-            else:
-                self.be.error("Module '{m}' not found.".format(m=name))
+        # Load modules and their requirements
+        self.load_modules(self.args)
 
         # After loading all modules, act on all environment variables that
         # have changed
-        self.process_modified()
-        self.be.export(self.env.modloaded_var, self.env.get_modloaded_str())
+        self.export_env()
+
+    def cmd_purge(self):
+        """Command 'purge': unload all loaded modules."""
+        self.init_env()
+        self.init_parser()
+
+        # Unload all modules in reverse order of loading and act on all
+        # environment variables that have changed
+        self.unload_all()
+        self.export_env()
+
+    def cmd_restore(self):
+        """Command 'restore': restore modules from a saved collection."""
+        self.init_env()
+        self.init_parser()
+
+        # Get collection name and load collection
+        name = (self.args[0] if len(self.args) > 0
+                else self.collection_default_name)
+        if not self.is_collection_name(name):
+            return
+        collection = Cache(self.collections_dir).load(name)
+        if not isinstance(collection, dict) or 'modules' not in collection:
+            self.be.error("Collection '{c}' not found.".format(c=name))
+            return
+        modules = collection['modules']
+
+        # Nothing needs to be done if exactly these modules are loaded
+        if [m['file'] for m in modules] == self.env.modloaded:
+            return
+
+        # Unload all modules
+        self.unload_all()
+
+        # If no module file has changed since the collection was saved, replay
+        # the saved commands without searching or reading any module file
+        if all([self.is_unchanged(m['file'], m['mtime'], m['size']) and
+                all([self.is_unchanged(*i) for i in m.get('includes', [])])
+                for m in modules]):
+            for m in modules:
+                commands = [(cmd, tuple(args)) for cmd, args in m['commands']]
+                self.parser.replay(commands)
+                self.env.add_loaded_module(m['file'])
+                self.record_journal(m['file'], commands)
+        # Otherwise load modules regularly and update the collection if all
+        # modules could be loaded
+        else:
+            names = [os.path.join(*self.decode_file(m['file']))
+                     for m in modules]
+            self.init_modules(names)
+            self.load_modules(names)
+            loaded = set([os.path.join(*self.decode_file(f))
+                          for f in self.env.modloaded])
+            if all([n in loaded for n in names]):
+                self.save_collection(name)
+
+        # After loading all modules, act on all environment variables that
+        # have changed
+        self.export_env()
+
+    def cmd_save(self):
+        """Command 'save': save loaded modules as a collection."""
+        self.init_env()
+        self.init_parser()
+
+        # Get collection name and save collection
+        name = (self.args[0] if len(self.args) > 0
+                else self.collection_default_name)
+        if self.is_collection_name(name) and self.save_collection(name):
+            self.be.echo("Saved {n} module(s) as collection '{c}'.".format(
+                    n=len(self.env.modloaded), c=name))
 
     def cmd_unload(self):
         """Command 'unload': unload all specified module files."""
-        self.init_modules()
+        self.init_env()
         self.init_parser()
 
-        # Unload each argument
-        for name in self.args:
+        # Unload each argument, but unload modules before the modules they
+        # require
+        from resolver import DependencyResolver
+        for name in DependencyResolver(self).resolve_unload(self.args):
             self.unload_module(name)
 
         # After unloadig all modules, act on all environment variables that
         # have changed
-        self.process_modified()
-        self.be.export(self.env.modloaded_var, self.env.get_modloaded_str())
+        self.export_env()
+
+    def cmd_switch(self):
+        """Command 'switch': replace a loaded module by another module."""
+        # Get old and new module (with a single argument, the loaded version
+        # of the same module is replaced)
+        if len(self.args) not in [1, 2]:
+            self.be.error("Command 'switch' expects one or two arguments.")
+            return
+        new = self.args[-1]
+        old = self.args[0] if len(self.args) == 2 else self.decode_name(new)[0]
+
+        self.init_modules([old, new])
+        self.init_parser()
+
+        # Check that the old module is loaded and the new module exists before
+        # changing anything
+        from resolver import DependencyResolver
+        resolver = DependencyResolver(self)
+        names = resolver.resolve_unload([old], check_dependents=False)
+        if not names:
+            self.be.error("Module '{m}' is not loaded.".format(m=old))
+            return
+        if self.find_module(new, strict=True) is None or (
+                self.get_module_file(new) is None):
+            self.be.error("Module '{m}' not found.".format(m=new))
+            return
+
+        # Nothing needs to be done if the new module is already loaded
+        newfile = self.get_module_file(new)
+        if newfile in self.env.modloaded:
+            return
+
+        # Modules that stay loaded must still find the modules they require
+        oldfiles = [f for f in self.env.modloaded
+                    if os.path.join(*self.decode_file(f)) in names]
+        for modfile in oldfiles:
+            dependents = resolver.get_dependents(modfile, oldfiles, newfile)
+            if dependents:
+                self.be.error("Module '{o}' not switched since it is required "
+                              "by {d}.".format(o=old, d=', '.join(
+                              ["'{0}'".format(os.path.join(
+                              *self.decode_file(f))) for f in dependents])))
+                return
+
+        # Remember the environment and the error state (errors of earlier
+        # commands in batch mode do not affect the switch)
+        state = self.env.get_state()
+        had_errors = self.be.has_errors
+        self.be.has_errors = False
+
+        # Unload old module and load new module with its requirements
+        for name in names:
+            self.unload_module(name)
+        self.load_modules([new])
+
+        # The switch is only applied if both steps succeeded, and then only the
+        # net changes of the whole switch are exported
+        failed = self.be.has_errors
+        self.be.has_errors = had_errors or failed
+        if failed:
+            self.env.set_state(state)
+            self.be.error("Module '{o}' was not switched to '{n}'.".format(
+                    o=old, n=new))
+            return
+        self.export_env()
+
+    def cmd_batch(self):
+        """Option '--batch': execute commands read from a file (or from stdin
+        if no file or '-' was given), one command with its arguments per line.
+
+        All commands share the environment handler and the module index, and
+        the modified environment variables are only exported once at the end.
+        Thus the result is the same as for executing the commands one after
+        another, but Modm is only started once.
+        """
+        if self.is_batch:
+            self.be.error("Option '--batch' cannot be used in batch mode.")
+            return
+
+        # Read commands
+        path = self.args[0] if len(self.args) > 0 else '-'
+        try:
+            if path == '-':
+                lines = sys.stdin.readlines()
+            else:
+                with open(path, 'r') as f:
+                    lines = f.readlines()
+        except (IOError, OSError):
+            self.be.error("Batch file '{f}' could not be read.".format(
+                    f=path))
+            return
+
+        # Stored command strings depend on the environment at the start, thus
+        # they cannot be used for any but the first command
+        self.use_eval_cache = False
+
+        # Execute each command (empty lines and comments are skipped, and
+        # commands may be prefixed by 'modm')
+        import shlex
+        self.is_batch = True
+        for n, line in enumerate(lines):
+            try:
+                argv = shlex.split(line, comments=True)
+            except ValueError as e:
+                self.be.error("Bad syntax in batch file '{f}' (line {n}): {e}"
+                              .format(f=path, n=n+1, e=e))
+                continue
+            if argv and argv[0] == 'modm':
+                argv = argv[1:]
+            if not argv:
+                continue
+            self.update_modpath()
+            self.cmd = argv[0]
+            self.args = argv[1:]
+            self.run_command()
+        self.is_batch = False
+
+        # Export the environment if any command used it
+        if self.is_init_env:
+            self.export_env()
+
+    def update_modpath(self):
+        """Use the current value of the modules path variable if it was
+        modified by a module file, and start module discovery over in this
+        case."""
+        if not self.is_init_env:
+            return
+        var = self.env.variables.get(self.modules_path_var)
+        if var is None:
+            return
+        value = var.get_value()
+        modpath = value.split(os.path.pathsep) if value else []
+        if modpath != self.env.modpath:
+            self.env.modpath = modpath
+            self.modules = []
+            self.module_map = dict()
+            self.discovered = set()
+            self.is_init_modules = False
+
+    def cmd_build_help_cache(self):
+        """Option '--build-help-cache': render all built-in help files and
+        store them in the help cache of the installation."""
+        doc_dir = self.get_doc_dir()
+        cache = Cache(os.path.join(doc_dir, self.help_cache_dir))
+
+        count = 0
+        for dirpath, dirnames, filenames in os.walk(doc_dir):
+            # Skip cache directory
+            if self.help_cache_dir in dirnames:
+                dirnames.remove(self.help_cache_dir)
+            for f in sorted(filenames):
+                if not f.endswith(self.help_file_suffix):
+                    continue
+                path = os.path.join(dirpath, f)
+                data = self.render_help(path, os.stat(path))
+                if data is None or not cache.store(
+                        self.get_help_cache_name(path), data):
+                    self.be.error("Help file '{f}' could not be cached in "
+                                  "'{d}'.".format(f=path, d=cache.directory))
+                    return
+                count += 1
+        self.be.echo("Cached {n} help file(s) in '{d}'.".format(
+                n=count, d=cache.directory))
 
     def cmd_version(self):
         """Print version information."""
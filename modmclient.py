@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+# Modm - Modules iMproved
+# Copyright (C) 2013-2014  Michael Schlottke
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+
+# System imports (only the bare minimum, since this script is the entry point
+# for each call of `modm`; all other modules are imported when needed)
+import os
+import sys
+
+# Environment variable with the path to the server socket
+socket_var = 'MODM_SERVER_SOCKET'
+
+# Environment variable to enable profiling (requests are not sent to the
+# server if it is set, since only in-process calls can be profiled)
+profile_var = 'MODM_PROFILE'
+
+# Time in seconds to wait for the server before falling back
+timeout = 10.0
+
+def main():
+    """If this file is run as a script, `main()` will be executed.
+
+    Sends the command to the Modm server and prints its output. If no server
+    is configured or it cannot handle the request, Modm is run in-process.
+
+    Since this script is small and imports `modm` as a module, it is also the
+    fastest way to start Modm without a server: only this file is compiled on
+    each call, while the byte code of all other modules is cached.
+    """
+    output = None
+    if os.environ.get(socket_var) and not os.environ.get(profile_var):
+        output = request(os.environ[socket_var], sys.argv, dict(os.environ))
+
+    # Fall back to in-process execution
+    if output is None:
+        import modm
+        modm.main()
+    else:
+        sys.stdout.write(output)
+
+def request(path, argv, environ):
+    """Send a request to the server at socket `path` and return the command
+    string to be eval'd, or None if the server cannot handle the request."""
+    import json
+    import socket
+    data = json.dumps({'argv': argv, 'environ': environ, 'cwd': os.getcwd()})
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.settimeout(timeout)
+    try:
+        s.connect(path)
+        s.sendall(data.encode('utf-8'))
+        s.shutdown(socket.SHUT_WR)
+        chunks = []
+        while True:
+            chunk = s.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        response = json.loads(b''.join(chunks).decode('utf-8'))
+    except (socket.error, OSError, ValueError):
+        return None
+    finally:
+        s.close()
+
+    # Only use output if server processed the request
+    if not isinstance(response, dict) or response.get('status') != 'ok':
+        return None
+    return response['output']
+
+
+# Run this script only if it is called directly
+if __name__ == '__main__':
+    main()
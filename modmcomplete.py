@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+# Modm - Modules iMproved
+# Copyright (C) 2013-2014  Michael Schlottke
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+
+# Entry point for the Bash completion of module names (cf.
+# `autocomplete/bash`). Usage:
+#
+#   modmcomplete.py names [prefix]       -- print names of all modules
+#   modmcomplete.py versions name/[ver]  -- print all versions of a module
+#
+# Only matches for `prefix` are printed, one per line. Module names and
+# versions are taken from the module index, which is cached persistently, so
+# only the module directories (for names) or the module folders of a single
+# module (for versions) need to be checked.
+
+# System imports
+import sys
+import os
+
+# Project imports
+from modm import Modm
+
+def main():
+    """If this file is run as a script, `main()` will be executed.
+
+    Prints all completions for the given kind and prefix.
+    """
+    if len(sys.argv) < 2:
+        return
+    kind = sys.argv[1]
+    prefix = sys.argv[2] if len(sys.argv) > 2 else ''
+
+    # Get modules path and index
+    modm = Modm()
+    modm.init_env()
+    index = modm.index
+
+    if kind == 'names':
+        completions = get_names(index, modm.env.modpath, prefix)
+    elif kind == 'versions':
+        completions = get_versions(index, modm.env.modpath, prefix)
+    else:
+        completions = []
+
+    # Store updated index for the next call
+    index.save()
+
+    if completions:
+        sys.stdout.write('\n'.join(completions) + '\n')
+
+def get_names(index, directories, prefix):
+    """Return names of all modules in `directories` starting with `prefix`."""
+    names = set()
+    for directory in directories:
+        try:
+            names.update(index.get_module_names(directory))
+        except OSError:
+            continue
+    return sorted([n for n in names if n.startswith(prefix)])
+
+def get_versions(index, directories, prefix):
+    """Return all 'name/version' strings of module `name` in `directories`
+    starting with `prefix`."""
+    name, _, _ = prefix.partition('/')
+    if not name or name.startswith('.'):
+        return []
+    versions = set()
+    for directory in directories:
+        try:
+            record = index.get_module(directory, name)
+        except OSError:
+            continue
+        if record is not None:
+            versions.update(record['versions'])
+    completions = [name + '/' + v for v in versions]
+    return sorted([c for c in completions if c.startswith(prefix)])
+
+
+# Run this script only if it is called directly
+if __name__ == '__main__':
+    main()
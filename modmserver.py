@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+
+# Modm - Modules iMproved
+# Copyright (C) 2013-2014  Michael Schlottke
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+
+# System imports
+import os
+import sys
+import json
+import signal
+import socket
+import struct
+import traceback
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+# Project imports
+from cache import Cache
+from modm import Modm
+from modfileparser import CompiledFiles
+from modindex import ModuleIndex
+
+def main():
+    """If this file is run as a script, `main()` will be executed.
+
+    Creates `ModmServer` instance listening on the socket given as the first
+    argument (or in the MODM_SERVER_SOCKET environment variable) and serves
+    requests until it is interrupted.
+    """
+    if len(sys.argv) > 1:
+        path = sys.argv[1]
+    elif ModmServer.socket_var in os.environ:
+        path = os.environ[ModmServer.socket_var]
+    else:
+        sys.stderr.write("usage: {s} <socket>\n".format(s=sys.argv[0]))
+        sys.exit(2)
+
+    # Shut down cleanly when terminated
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    server = ModmServer(path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+class ModmRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Class to handle a single request to the Modm server.
+
+    A request is a JSON object with the command line arguments (`argv`), the
+    environment variables (`environ`) and the working directory (`cwd`) of the
+    client. The client has to shut down its side of the connection after
+    sending the request. The response is a JSON object with a `status` that is
+    either 'ok' (in which case `output` contains the command string to be
+    eval'd) or 'fallback' (the client has to execute the command itself).
+
+    Requests from other users than the one running the server are refused
+    (the client falls back in this case), since the server would otherwise
+    read files on their behalf with its own permissions.
+    """
+
+    # Time in seconds to wait for the client to send its request (requests
+    # are processed one after another, thus a stalled client must not block
+    # the server for long)
+    timeout = 1.0
+
+    def handle(self):
+        """Read request, process it and send response."""
+        try:
+            if not self.is_same_user():
+                response = {'status': 'fallback'}
+            else:
+                request = json.loads(self.rfile.read().decode('utf-8'))
+                response = self.server.process(request)
+        except socket.timeout:
+            response = {'status': 'fallback'}
+        except Exception:
+            traceback.print_exc()
+            response = {'status': 'fallback'}
+        try:
+            self.wfile.write(json.dumps(response).encode('utf-8'))
+        except (socket.error, OSError):
+            pass
+
+    def is_same_user(self):
+        """Return True if the client runs as the same user as the server.
+
+        Where the credentials of the client are not available, only the
+        permissions of the socket restrict access (cf. `ModmServer`).
+        """
+        if not hasattr(socket, 'SO_PEERCRED'):
+            return True
+        creds = self.request.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                                        struct.calcsize('3i'))
+        _, uid, _ = struct.unpack('3i', creds)
+        return uid == os.getuid()
+
+
+class ModmServer(socketserver.UnixStreamServer):
+    """
+    Class to serve Modm commands from a Unix domain socket.
+
+    The server keeps the module index and all compiled module files in memory
+    across requests, thus a command only needs to check the modification times
+    of the module directories and module files instead of starting a new
+    interpreter and scanning the module tree. Requests are processed one after
+    another.
+
+    Commands that change per-user files are not served but handed back to the
+    client (cf. `local_commands`).
+
+    The server only serves the user running it: the socket is only accessible
+    for this user and the credentials of each client are checked as well.
+    Thus module paths and files are read with the same permissions as
+    in-process execution, and each user who wants to use a server needs to
+    start their own.
+    """
+
+    socket_var = 'MODM_SERVER_SOCKET'
+    socket_mode = 0o600
+    local_commands = ['--batch', 'restore', 'save']
+
+    def __init__(self, path):
+        """Create socket at `path` and initialize shared data.
+
+        Arguments:
+          path -- path to Unix domain socket (a stale socket file is removed)
+        """
+        # Remove stale socket from an earlier server
+        if os.path.exists(path):
+            os.remove(path)
+
+        # Init server and make socket accessible only for the current user
+        # (the umask is set while binding, so that the socket is never
+        # accessible for others)
+        umask = os.umask(0o777 & ~self.socket_mode)
+        try:
+            socketserver.UnixStreamServer.__init__(self, path,
+                                                   ModmRequestHandler)
+        finally:
+            os.umask(umask)
+        os.chmod(path, self.socket_mode)
+        self.path = path
+
+        # Init shared data (the index is stored in the cache of the user, so
+        # that a restarted server starts out warm)
+        modm = Modm()
+        self.cache = modm.cache
+        self.index = ModuleIndex(self.cache,
+                                 default_file=Modm.module_default_file,
+                                 help_file=Modm.module_help_file,
+                                 category_file=Modm.module_category_file,
+                                 threads=modm.scan_threads)
+        self.compiled = CompiledFiles()
+
+    def server_close(self):
+        """Close server and remove socket."""
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def process(self, request):
+        """Execute Modm command for `request` and return response."""
+        # Change to working directory of client to resolve relative paths
+        os.chdir(request['cwd'])
+
+        # Create Modm instance with the arguments and environment of the client
+        # (messages cannot be written to the display of the client directly)
+        environ = dict(request['environ'])
+        environ.pop(Modm.display_fd_var, None)
+        modm = Modm(request['argv'], environ=environ)
+        modm.init_argv()
+        command, _ = modm.parse_command(modm.cmd)
+        if command in self.local_commands or modm.output_format != 'bash':
+            return {'status': 'fallback'}
+
+        # Use shared data (the memory used for compiled module files is
+        # bounded, cf. `CompiledFiles`)
+        modm.cache = self.cache
+        modm.index = self.index
+        modm.compiled = self.compiled
+
+        # Run command and capture output
+        stream = StringIO()
+        try:
+            modm.run(stream)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            os.chdir('/')
+
+        return {'status': 'ok', 'output': stream.getvalue()}
+
+
+# Run this script only if it is called directly
+if __name__ == '__main__':
+    main()
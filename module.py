@@ -18,6 +18,9 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
 
+# System imports
+import os
+
 class Module:
     """
     Class to store information about a module.
@@ -26,8 +29,35 @@ class Module:
     def __init__(self):
         """Reset all member variables to default state."""
         self.name = None
+        self.sort_key = None
         self.versions = []
+        self.version_files = dict()
+        self.version_keys = dict()
         self.loaded = None
         self.default = None
         self.help_file = None
         self.category = None
+
+    def add_version(self, modfile, sort_key=None):
+        """Add module file `modfile` as a version if no module file with the
+        same version exists yet. Return true if it was added.
+
+        `sort_key` is the natural sort key of the version (cf.
+        `natsort.natsort_key()`), which is used to sort the versions.
+        """
+        modversion = os.path.basename(modfile)
+        if modversion in self.version_files:
+            return False
+        self.version_files[modversion] = modfile
+        self.version_keys[modfile] = sort_key
+        self.versions.append(modfile)
+        return True
+
+    def has_version(self, modversion):
+        """Return true if a module file exists for version `modversion`."""
+        return modversion in self.version_files
+
+    def get_version_file(self, modversion):
+        """Return module file for version `modversion` or None if there is
+        none."""
+        return self.version_files.get(modversion)
@@ -23,26 +23,32 @@
 
 import re
 
+# Pattern to split strings into numeric and non-numeric parts
+_digits = re.compile('([0-9]+)')
+
+def natsort_key(s):
+    """Return key to sort string `s` in a way that humans expect.
+
+    The key is a list of alternating non-numeric (string) and numeric
+    (integer) parts, which always starts with a string part. It can thus be
+    stored in JSON format and still be compared after loading it again.
+    """
+    return [int(c) if c.isdigit() else c for c in _digits.split(s)]
+
 def natsorted(l, **args):
     """Sort the given iterable in a way that humans expect."""
-    # Define method to convert items to integers
-    convert = lambda s: int(s) if s.isdigit() else s
-
     # Return None if 'cmp' is set since it is not supported
     if 'cmp' in args:
         return None
 
-    # Define lambda `keyfun` to translate values if a `key` argument
-    # was specified
+    # Define lambda to get alphanumeric key, translating values first if a
+    # `key` argument was specified
     if 'key' in args:
         keyfun = args['key']
         del args['key']
+        alphanum_key = lambda key: natsort_key(keyfun(key))
     else:
-        keyfun = lambda x: x
-
-    # Define lambda to get alphanumeric key
-    alphanum_key = lambda key: [convert(c) for c in
-            re.split('([0-9]+)', keyfun(key))]
+        alphanum_key = natsort_key
 
     # Return new list that is sorted naturally, while passing on all
     # other arguments to `sorted()`
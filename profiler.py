@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+
+# Modm - Modules iMproved
+# Copyright (C) 2013-2014  Michael Schlottke
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+
+# System imports
+import os
+import sys
+import time
+try:
+    import builtins
+except ImportError:
+    import __builtin__ as builtins
+
+class Profiler:
+    """
+    Class to measure the wall time and the number of calls of the phases of a
+    Modm call, as well as the number of file system calls.
+
+    While the profiler is installed, the methods of each phase and the file
+    system functions are replaced by wrappers that record each call. Times are
+    inclusive, i.e. the time of a phase contains the time of all phases that
+    are called by it. The report is never written to stdout, since stdout is
+    eval'd by the shell.
+    """
+
+    # Phases to measure as (class name, method name)
+    phases = [('Modm', 'init_env'),
+              ('Modm', 'init_modules'),
+              ('ModfileParser', 'parse'),
+              ('Modm', 'process_modified'),
+              ('Modm', 'print_modules'),
+              ('BashEval', 'cmdstring')]
+
+    # File system calls to count as (module, function name)
+    calls = [(os, 'listdir'), (os, 'stat'), (builtins, 'open')]
+    if hasattr(os, 'scandir'):
+        calls.append((os, 'scandir'))
+
+    def __init__(self, modm_class):
+        """Save Modm class to profile (which is not necessarily the one from
+        the `modm` module, e.g. if modm.py is run as a script) and initialize
+        member variables."""
+        self.modm_class = modm_class
+        self.counts = dict()
+        self.times = dict()
+        self.originals = []
+        self.start = None
+        self.elapsed = None
+
+    def install(self):
+        """Replace all phase methods and file system functions by wrappers
+        that record their calls."""
+        from basheval import BashEval
+        from modfileparser import ModfileParser
+        classes = {'Modm': self.modm_class, 'BashEval': BashEval,
+                   'ModfileParser': ModfileParser}
+        for classname, methodname in self.phases:
+            self.patch(classes[classname], methodname,
+                       classname + '.' + methodname, True)
+        for obj, name in self.calls:
+            self.patch(obj, name, name, False)
+        self.start = time.time()
+
+    def uninstall(self):
+        """Restore all original methods and functions."""
+        self.elapsed = time.time() - self.start
+        for obj, name, original in reversed(self.originals):
+            setattr(obj, name, original)
+        self.originals = []
+
+    def patch(self, obj, name, label, timed):
+        """Replace attribute `name` of `obj` by a wrapper that counts calls
+        (and measures their time if `timed` is true) under `label`."""
+        original = obj.__dict__[name]
+        self.originals.append((obj, name, original))
+        self.counts[label] = 0
+        if timed:
+            self.times[label] = 0.0
+
+        def wrapper(*args, **kwargs):
+            self.counts[label] += 1
+            if not timed:
+                return original(*args, **kwargs)
+            start = time.time()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.times[label] += time.time() - start
+        setattr(obj, name, wrapper)
+
+    def report(self, stream, title=None):
+        """Write profiling results to `stream`."""
+        lines = []
+        if title:
+            lines.append('modm profile: {t}'.format(t=title))
+        lines.append('{0:<30} {1:>8} {2:>12}'.format('phase', 'calls',
+                                                     'time [ms]'))
+        for classname, methodname in self.phases:
+            label = classname + '.' + methodname
+            lines.append('{0:<30} {1:>8} {2:>12.3f}'.format(
+                    label, self.counts[label], self.times[label] * 1000))
+        lines.append('{0:<30} {1:>8}'.format('file system call', 'calls'))
+        for obj, name in self.calls:
+            lines.append('{0:<30} {1:>8}'.format(name, self.counts[name]))
+        lines.append('{0:<30} {1:>8} {2:>12.3f}'.format(
+                'total', '', self.elapsed * 1000))
+        stream.write('\n'.join(lines) + '\n')
+
+def profile(function, modm_class, destination, title=None):
+    """Call `function` while profiling the phases of `modm_class` and write
+    the report to `destination`.
+
+    If `destination` is '1', 'on', 'yes', 'true' or 'stderr', the report is
+    written to stderr, otherwise it is appended to the file `destination`.
+    """
+    profiler = Profiler(modm_class)
+    profiler.install()
+    try:
+        function()
+    finally:
+        profiler.uninstall()
+        if destination.lower() in ['1', 'on', 'yes', 'true', 'stderr']:
+            profiler.report(sys.stderr, title)
+        else:
+            try:
+                with open(destination, 'a') as f:
+                    profiler.report(f, title)
+            except (IOError, OSError):
+                profiler.report(sys.stderr, title)
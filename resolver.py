@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+
+# Modm - Modules iMproved
+# Copyright (C) 2013-2014  Michael Schlottke
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+
+# System imports
+import os
+
+class DependencyResolver:
+    """
+    Class to resolve requirements and conflicts between modules.
+
+    Before any module is loaded, the dependency graph of all modules to load
+    is built once from the module index and the (compiled) module files. The
+    modules are then ordered such that each module is loaded after all modules
+    it requires. Modules that are not found, that conflict with other modules,
+    or that are part of a circular dependency are not loaded, and neither are
+    the modules that depend on them.
+    """
+
+    def __init__(self, modm):
+        """Save Modm object that provides access to the module index, the
+        module file parser, the environment and the BashEval object."""
+        self.modm = modm
+        self.be = modm.be
+
+        # Init other members
+        self.loaded = dict()
+        self.modfiles = dict()
+        self.requires = dict()
+        self.conflicts = dict()
+        self.added = []
+        self.failed = set()
+        self.kept = dict()
+        self.loaded_requires = dict()
+
+    def matches(self, name, modfile):
+        """Return true if module file `modfile` is a version of module `name`
+        (any version if `name` does not contain a version)."""
+        modname, modversion = self.modm.decode_name(name)
+        n, v = self.modm.decode_file(modfile)
+        return n == modname and (modversion is None or v == modversion)
+
+    def display_name(self, modname):
+        """Return qualified name of module `modname` for messages."""
+        if modname in self.modfiles:
+            return os.path.join(*self.modm.decode_file(self.modfiles[modname]))
+        return modname
+
+    def resolve_load(self, names):
+        """Return the qualified names of all modules that need to be loaded in
+        order to load the modules `names`, in the order in which they have to
+        be loaded. Module files that are already loaded are not included."""
+        # Get currently loaded module files by module name
+        for modfile in self.modm.env.modloaded:
+            self.loaded[self.modm.decode_file(modfile)[0]] = modfile
+
+        # Build dependency graph for all requested modules
+        roots = []
+        for name in names:
+            modname = self.add(name)
+            if modname is not None and modname not in roots:
+                roots.append(modname)
+
+        # Check conflicts and determine load order
+        self.check_conflicts()
+        order = []
+        state = dict()
+        for modname in roots:
+            self.visit(modname, state, [], order)
+
+        # Report loaded modules that are replaced by another version (only
+        # modules requested explicitly can replace a loaded version)
+        for modname in order:
+            if modname in self.loaded and (
+                    self.loaded[modname] != self.modfiles[modname]):
+                self.be.echo("Replacing loaded module '{l}' by '{m}'.".format(
+                        l=os.path.join(*self.modm.decode_file(
+                        self.loaded[modname])), m=self.display_name(modname)))
+
+        return [self.display_name(m) for m in order
+                if self.modfiles[m] not in self.modm.env.modloaded]
+
+    def add(self, name, dependent=None):
+        """Add module `name` and all modules it requires to the graph.
+
+        `dependent` is the module name of the module that requires `name`, or
+        None if `name` was requested directly. Return the module name of the
+        added module, or None if nothing needs to be loaded for `name`.
+        """
+        modname, modversion = self.modm.decode_name(name)
+
+        # Check modules that are already in the graph
+        if modname in self.modfiles:
+            modfile = self.modfiles[modname]
+            if modversion is None or os.path.basename(modfile) == modversion:
+                return modname
+            # A later request replaces an earlier one, but requirements must
+            # match the version that is loaded
+            elif dependent is not None:
+                self.be.error("Module '{d}' requires '{r}', but '{m}' is "
+                              "loaded instead.".format(
+                              d=self.display_name(dependent), r=name,
+                              m=self.display_name(modname)))
+                self.failed.add(dependent)
+                return None
+
+        # Requirements are satisfied by matching modules that are loaded, which
+        # are kept unless another version is requested explicitly (a loaded
+        # module is never replaced to satisfy a requirement)
+        if dependent is not None and modname in self.loaded:
+            if self.matches(name, self.loaded[modname]):
+                self.kept.setdefault(modname, []).append((dependent, name))
+                return None
+            self.be.error("Module '{d}' requires '{r}', but '{m}' is "
+                          "loaded.".format(
+                          d=self.display_name(dependent), r=name,
+                          m=os.path.join(*self.modm.decode_file(
+                          self.loaded[modname]))))
+            self.failed.add(dependent)
+            return None
+
+        # Find module file
+        self.modm.init_modules([name])
+        modfile = None
+        if self.modm.find_module(name, strict=True) is not None:
+            modfile = self.modm.get_module_file(name)
+        if modfile is None:
+            if dependent is None:
+                self.be.error("Module '{m}' not found.".format(m=name))
+            else:
+                self.be.error("Module '{d}' requires '{r}', which was not "
+                              "found.".format(d=self.display_name(dependent),
+                              r=name))
+                self.failed.add(dependent)
+            return None
+
+        # Add module and its requirements (modules that are already in the
+        # graph are not added again, thus cycles do not lead to recursion)
+        self.modfiles[modname] = modfile
+        self.requires[modname] = []
+        self.conflicts[modname] = []
+        if modname not in self.added:
+            self.added.append(modname)
+
+        # Requirements that were satisfied by the loaded version of the module
+        # must also be satisfied by the version that replaces it
+        for d, r in self.kept.pop(modname, []):
+            if self.matches(r, modfile):
+                self.requires[d].append(modname)
+            else:
+                self.be.error("Module '{d}' requires '{r}', but '{m}' is "
+                              "loaded instead.".format(
+                              d=self.display_name(d), r=r,
+                              m=self.display_name(modname)))
+                self.failed.add(d)
+        dependencies = self.modm.get_dependencies(modfile)
+        if dependencies is None:
+            self.failed.add(modname)
+            return modname
+        requires, self.conflicts[modname] = dependencies
+        for r in requires:
+            required = self.add(r, dependent=modname)
+            if required is not None and (
+                    required not in self.requires[modname]):
+                self.requires[modname].append(required)
+
+        return modname
+
+    def check_conflicts(self):
+        """Mark all modules in the graph as failed that conflict with another
+        module that is loaded or will be loaded."""
+        # Get module files by module name as they will be after loading
+        active = dict(self.loaded)
+        active.update(self.modfiles)
+
+        # Check conflicts declared by modules in the graph
+        for modname in self.added:
+            for c in self.conflicts[modname]:
+                cname, cversion = self.modm.decode_name(c)
+                if cname != modname and cname in active and (
+                        cversion is None or
+                        os.path.basename(active[cname]) == cversion):
+                    self.be.error("Module '{m}' conflicts with '{c}'.".format(
+                            m=self.display_name(modname),
+                            c=os.path.join(*self.modm.decode_file(
+                            active[cname]))))
+                    self.failed.add(modname)
+                    break
+
+        # Check conflicts declared by loaded modules that stay loaded
+        for lname, lfile in self.loaded.items():
+            if lname in self.modfiles:
+                continue
+            dependencies = self.modm.get_dependencies(lfile)
+            for c in dependencies[1] if dependencies else []:
+                cname, cversion = self.modm.decode_name(c)
+                if cname in self.modfiles and cname not in self.failed and (
+                        cversion is None or
+                        os.path.basename(self.modfiles[cname]) == cversion):
+                    self.be.error("Module '{m}' conflicts with loaded module "
+                                  "'{l}'.".format(m=self.display_name(cname),
+                                  l=os.path.join(*self.modm.decode_file(
+                                  lfile))))
+                    self.failed.add(cname)
+
+    def visit(self, modname, state, stack, order):
+        """Visit module `modname` and all modules it requires depth-first and
+        append them to `order` after their requirements. Return true if the
+        module can be loaded."""
+        # Modules that were visited before
+        if state.get(modname) == 'done':
+            return modname not in self.failed
+        if state.get(modname) == 'visiting':
+            cycle = stack[stack.index(modname):]
+            self.be.error("Circular dependency between modules {m}.".format(
+                    m=', '.join(["'{0}'".format(self.display_name(m))
+                                 for m in cycle])))
+            self.failed.update(cycle)
+            return False
+
+        # Visit requirements first
+        state[modname] = 'visiting'
+        stack.append(modname)
+        for r in self.requires[modname]:
+            if not self.visit(r, state, stack, order) and (
+                    modname not in self.failed):
+                self.be.error("Module '{m}' not loaded since required module "
+                              "'{r}' could not be loaded.".format(
+                              m=self.display_name(modname),
+                              r=self.display_name(r)))
+                self.failed.add(modname)
+        stack.pop()
+        state[modname] = 'done'
+
+        if modname not in self.failed:
+            order.append(modname)
+        return modname not in self.failed
+
+    def resolve_unload(self, names, check_dependents=True):
+        """Return the qualified names of all loaded modules that match the
+        modules `names`, ordered such that each module is unloaded before the
+        modules it requires.
+
+        If `check_dependents` is true, modules that are required by loaded
+        modules that stay loaded are not unloaded and an error is issued.
+        """
+        # Get matching loaded module files in the order of the arguments
+        modfiles = []
+        for name in names:
+            for modfile in self.modm.env.modloaded:
+                if self.matches(name, modfile) and modfile not in modfiles:
+                    modfiles.append(modfile)
+
+        # Keep modules that are required by modules that stay loaded (which
+        # may in turn keep the modules they require)
+        while check_dependents:
+            for modfile in modfiles:
+                dependents = self.get_dependents(modfile, modfiles)
+                if dependents:
+                    break
+            else:
+                break
+            self.be.error("Module '{m}' not unloaded since it is required by "
+                          "{d}.".format(m=os.path.join(
+                          *self.modm.decode_file(modfile)), d=', '.join(
+                          ["'{0}'".format(os.path.join(
+                          *self.modm.decode_file(f))) for f in dependents])))
+            modfiles.remove(modfile)
+
+        # Determine which of these modules require each other
+        required_by = dict((f, []) for f in modfiles)
+        for modfile in modfiles:
+            for r in self.get_requires(modfile):
+                for f in modfiles:
+                    if f != modfile and self.matches(r, f):
+                        required_by[f].append(modfile)
+
+        # Unload modules after all modules that require them
+        order = []
+        visited = set()
+        for modfile in modfiles:
+            self.visit_unload(modfile, required_by, visited, order)
+
+        return [os.path.join(*self.modm.decode_file(f)) for f in order]
+
+    def get_requires(self, modfile):
+        """Return list of modules required by loaded module file `modfile`."""
+        if modfile not in self.loaded_requires:
+            dependencies = self.modm.get_dependencies(modfile)
+            self.loaded_requires[modfile] = (dependencies[0] if dependencies
+                                             else [])
+        return self.loaded_requires[modfile]
+
+    def get_dependents(self, modfile, unloaded, replacement=None):
+        """Return list of loaded module files that require module file
+        `modfile`, except for those in `unloaded`. If `replacement` is given,
+        modules whose requirement is also satisfied by this module file are
+        omitted."""
+        dependents = []
+        for f in self.modm.env.modloaded:
+            if f in unloaded:
+                continue
+            for r in self.get_requires(f):
+                if self.matches(r, modfile) and (replacement is None or
+                        not self.matches(r, replacement)):
+                    dependents.append(f)
+                    break
+        return dependents
+
+    def visit_unload(self, modfile, required_by, visited, order):
+        """Append all modules that require module file `modfile` to `order`,
+        followed by `modfile` itself."""
+        if modfile in visited:
+            return
+        visited.add(modfile)
+        for f in required_by[modfile]:
+            self.visit_unload(f, required_by, visited, order)
+        order.append(modfile)
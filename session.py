@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+# Modm - Modules iMproved
+# Copyright (C) 2013-2014  Michael Schlottke
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+
+# System imports
+import os
+
+# Project imports
+from modm import Modm
+from modfileparser import CompiledFiles
+from modindex import ModuleIndex
+
+class SessionError(Exception):
+    """
+    Class for errors that occurred while running a Modm command in a session.
+    The error messages are available as `errors`.
+    """
+
+    def __init__(self, errors):
+        Exception.__init__(self, '\n'.join(errors))
+        self.errors = errors
+
+class Session:
+    """
+    Class to load and unload modules from Python without starting a
+    subprocess or a shell.
+
+    The modifications are applied directly to an environment mapping (e.g.
+    `os.environ`) and returned as a dictionary. The module index, the compiled
+    module files and the cache are kept between calls, thus only changed
+    module directories and module files are read again. Example:
+
+        session = Session()
+        diff = session.load('gcc', 'openmpi')
+        subprocess.call(['mpicc', 'hello.c'])
+        session.unload('openmpi')
+    """
+
+    def __init__(self, environ=None, strict=True):
+        """Save arguments and initialize shared data.
+
+        Arguments:
+          environ -- mapping with the environment variables to use and modify
+                     (default: `os.environ`); Modm settings (e.g. the modules
+                     path or the cache directory) are taken from it
+          strict  -- if true, a `SessionError` is raised if a command issued
+                     any errors (after the environment was modified)
+        """
+        # Save arguments
+        self.environ = os.environ if environ is None else environ
+        self.strict = strict
+
+        # Init shared data
+        modm = Modm(environ=self.environ)
+        self.cache = modm.cache
+        self.index = ModuleIndex(self.cache,
+                                 default_file=Modm.module_default_file,
+                                 help_file=Modm.module_help_file,
+                                 category_file=Modm.module_category_file,
+                                 threads=modm.scan_threads)
+        self.compiled = CompiledFiles()
+
+        # Init other members
+        self.messages = ''
+        self.errors = []
+
+    def load(self, *names):
+        """Load modules `names` and return the modified variables (cf.
+        `run()`)."""
+        return self.run(['load'] + list(names))
+
+    def unload(self, *names):
+        """Unload modules `names` and return the modified variables (cf.
+        `run()`)."""
+        return self.run(['unload'] + list(names))
+
+    def loaded(self):
+        """Return names of all loaded modules as 'name/version' strings in the
+        order in which they were loaded."""
+        modloaded = self.environ.get(Modm.modules_loaded_var)
+        if not modloaded:
+            return []
+        return ['/'.join(os.path.normpath(f).split(os.path.sep)[-2:])
+                for f in modloaded.split(os.path.pathsep)]
+
+    def run(self, args):
+        """Run Modm command with arguments `args` (e.g. ['load', 'gcc']),
+        apply the modifications to the environment and return them as a
+        dictionary that maps each modified variable to its new value (None if
+        it was unset).
+
+        The messages and error messages of the command are available as
+        `messages` and `errors` afterwards.
+        """
+        # Let Modm report the modifications instead of producing Bash
+        # commands
+        environ = dict(self.environ)
+        environ[Modm.output_format_var] = 'json'
+        environ.pop(Modm.display_fd_var, None)
+        modm = Modm(['modm.py'] + list(args), environ=environ)
+
+        # Use shared data
+        modm.cache = self.cache
+        modm.index = self.index
+        modm.compiled = self.compiled
+
+        # Run command (without writing its output anywhere)
+        modm.rununsafe()
+        diff = dict(modm.be.variables)
+        self.messages = ''.join(modm.be.messages)
+        self.errors = list(modm.be.errors)
+
+        # Apply modifications
+        for name, value in diff.items():
+            if value is None:
+                if name in self.environ:
+                    del self.environ[name]
+            else:
+                self.environ[name] = value
+
+        if self.strict and self.errors:
+            raise SessionError(self.errors)
+        return diff
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+
+# Modm - Modules iMproved
+# Copyright (C) 2013-2014  Michael Schlottke
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+# Unit tests for the path handling of environment variables (`PathList` and
+# path-type `EnvVariable` objects). Run with: python -m unittest discover tests
+
+# System imports
+import os
+import random
+import sys
+import unittest
+
+# Project imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(
+        __file__))))
+from env import EnvVariable, PathList
+
+def join(*paths):
+    """Return `paths` joined into a single value of a path variable."""
+    return os.path.pathsep.join(paths)
+
+class PathListTest(unittest.TestCase):
+    """
+    Class to test the ordered list of paths.
+    """
+
+    def test_prepend_append(self):
+        paths = PathList(['b'])
+        paths.prepend('a')
+        paths.append('c')
+        self.assertEqual(list(paths), ['a', 'b', 'c'])
+        self.assertEqual(len(paths), 3)
+        self.assertTrue('b' in paths)
+        self.assertFalse('d' in paths)
+
+    def test_duplicates(self):
+        paths = PathList(['a', 'b', 'a'])
+        paths.prepend('a')
+        self.assertEqual(list(paths), ['a', 'a', 'b', 'a'])
+        self.assertEqual(paths.count('a'), 3)
+        self.assertEqual(paths.count('c'), 0)
+
+    def test_remove_first(self):
+        paths = PathList(['a', 'b', 'a', 'c', 'a'])
+        self.assertTrue(paths.remove_first('a'))
+        self.assertEqual(list(paths), ['b', 'a', 'c', 'a'])
+        self.assertTrue(paths.remove_first('a'))
+        self.assertEqual(list(paths), ['b', 'c', 'a'])
+        self.assertFalse(paths.remove_first('d'))
+        self.assertEqual(len(paths), 3)
+
+    def test_remove_last(self):
+        paths = PathList(['a', 'b', 'a', 'c', 'a'])
+        self.assertTrue(paths.remove_last('a'))
+        self.assertEqual(list(paths), ['a', 'b', 'a', 'c'])
+        self.assertTrue(paths.remove_last('a'))
+        self.assertEqual(list(paths), ['a', 'b', 'c'])
+        self.assertFalse(paths.remove_last('d'))
+
+    def test_remove_all(self):
+        paths = PathList(['a', 'a'])
+        paths.remove_last('a')
+        paths.remove_first('a')
+        self.assertEqual(list(paths), [])
+        self.assertEqual(len(paths), 0)
+        self.assertFalse('a' in paths)
+        paths.append('b')
+        self.assertEqual(list(paths), ['b'])
+
+    def test_random_operations(self):
+        # Compare with the semantics of a plain list
+        rng = random.Random(42)
+        paths = PathList()
+        expected = []
+        for _ in range(5000):
+            path = rng.choice('abcdef')
+            operation = rng.randrange(4)
+            if operation == 0:
+                paths.prepend(path)
+                expected.insert(0, path)
+            elif operation == 1:
+                paths.append(path)
+                expected.append(path)
+            elif operation == 2:
+                self.assertEqual(paths.remove_first(path), path in expected)
+                if path in expected:
+                    expected.remove(path)
+            else:
+                self.assertEqual(paths.remove_last(path), path in expected)
+                if path in expected:
+                    del expected[len(expected) - 1 -
+                                 expected[::-1].index(path)]
+            self.assertEqual(list(paths), expected)
+            self.assertEqual(len(paths), len(expected))
+
+
+class EnvVariableTest(unittest.TestCase):
+    """
+    Class to test path-type environment variables.
+    """
+
+    def get_variable(self, value=None, refs=None):
+        """Return path variable 'TEST' with initial `value`."""
+        environ = dict() if value is None else {'TEST': value}
+        return EnvVariable('TEST', kind='path', environ=environ, refs=refs)
+
+    def test_prepend_undo_removes_first_occurrence(self):
+        var = self.get_variable(join('/b', '/a', '/c', '/a'))
+        var.prepend('/a')
+        self.assertEqual(var.get_value(), join('/a', '/b', '/a', '/c', '/a'))
+        var.prepend('/a', undo=True)
+        self.assertEqual(var.get_value(), join('/b', '/a', '/c', '/a'))
+        var.prepend('/a', undo=True)
+        self.assertEqual(var.get_value(), join('/b', '/c', '/a'))
+
+    def test_append_undo_removes_last_occurrence(self):
+        var = self.get_variable(join('/a', '/b', '/a', '/c'))
+        var.append('/a')
+        self.assertEqual(var.get_value(), join('/a', '/b', '/a', '/c', '/a'))
+        var.append('/a', undo=True)
+        self.assertEqual(var.get_value(), join('/a', '/b', '/a', '/c'))
+        var.append('/a', undo=True)
+        self.assertEqual(var.get_value(), join('/a', '/b', '/c'))
+
+    def test_undo_missing_path(self):
+        var = self.get_variable(join('/a', '/b'))
+        var.prepend('/c', undo=True)
+        var.append('/c', undo=True)
+        self.assertEqual(var.get_value(), join('/a', '/b'))
+
+    def test_unset_variable(self):
+        var = self.get_variable()
+        self.assertFalse(var.is_set())
+        var.prepend('/a')
+        self.assertEqual(var.get_value(), '/a')
+        var.prepend('/a', undo=True)
+        self.assertEqual(var.get_value(), '')
+        self.assertFalse(var.is_changed())
+
+    def test_set_value_round_trip(self):
+        var = self.get_variable('/x')
+        for value in [join('/a', '/b', '/a'), '', '/c', join('/a', '', '/b')]:
+            var.set_value(value)
+            self.assertEqual(var.get_value(), value)
+        var.set_value(join('/a', '/b'))
+        var.append('/c')
+        var.prepend('/a', undo=True)
+        self.assertEqual(var.get_value(), join('/b', '/c'))
+
+    def test_load_round_trip(self):
+        for value in ['', '/a', join('/a', '/b', '/a'), join('/a', '', '/b')]:
+            var = self.get_variable(value)
+            self.assertEqual(var.get_value(), value)
+            self.assertFalse(var.is_changed())
+
+    def test_reference_counting(self):
+        refs = dict()
+        var = self.get_variable(join('/a', '/b'), refs=refs)
+        var.prepend('/c')
+        var.prepend('/c')
+        var.prepend('/b')
+        self.assertEqual(var.get_value(), join('/c', '/a', '/b'))
+        self.assertEqual(refs, {'/b': 2, '/c': 2})
+        var.prepend('/c', undo=True)
+        self.assertEqual(var.get_value(), join('/c', '/a', '/b'))
+        self.assertEqual(refs, {'/b': 2})
+        var.prepend('/c', undo=True)
+        var.prepend('/b', undo=True)
+        self.assertEqual(var.get_value(), join('/a', '/b'))
+        self.assertEqual(refs, {})
+        self.assertFalse(var.is_changed())
+
+    def test_reference_counting_append(self):
+        refs = {'/a': 3}
+        var = self.get_variable(join('/a', '/b'), refs=refs)
+        var.append('/a')
+        self.assertEqual(refs, {'/a': 4})
+        for _ in range(3):
+            var.append('/a', undo=True)
+        self.assertEqual(var.get_value(), join('/a', '/b'))
+        self.assertEqual(refs, {})
+        var.append('/a', undo=True)
+        self.assertEqual(var.get_value(), '/b')
+
+    def test_stale_reference_counts(self):
+        # Counts of paths that are no longer present are ignored
+        refs = {'/c': 5}
+        var = self.get_variable('/a', refs=refs)
+        var.prepend('/c')
+        self.assertEqual(var.get_value(), join('/c', '/a'))
+        self.assertEqual(refs, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+# Modm - Modules iMproved
+# Copyright (C) 2013-2014  Michael Schlottke
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+# Unit tests for the load journal, in particular that modules with a malformed
+# journal entry can still be unloaded. Run with:
+# python -m unittest discover tests
+
+# System imports
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# Project imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(
+        __file__))))
+from env import Env
+from modfileparser import ModfileParser
+from modm import Modm
+
+class Buffer:
+    """
+    Class to collect the output of Modm.
+    """
+
+    def __init__(self):
+        self.text = ''
+
+    def write(self, text):
+        self.text += text
+
+class JournalEntryTest(unittest.TestCase):
+    """
+    Class to test reading entries from the load journal.
+    """
+
+    def get_entry(self, entry):
+        environ = {'MODM_LOAD_JOURNAL': json.dumps({'/m/a/1': entry})}
+        return Env(environ=environ).get_journal_entry(
+                '/m/a/1', ModfileParser().nargs)
+
+    def test_valid(self):
+        self.assertEqual(self.get_entry([['set', 'X', '1'],
+                                         ['requires', 'b']]),
+                         [('set', ('X', '1')), ('requires', ('b',))])
+        self.assertEqual(self.get_entry([]), [])
+
+    def test_malformed(self):
+        for entry in [[['bogus', 'X']], [[]], [['set', 'X']],
+                      [['set', 'X', 1]], ['set'], [[None]], {'set': 'X'}]:
+            self.assertEqual(self.get_entry(entry), None, entry)
+
+    def test_missing(self):
+        env = Env(environ={'MODM_LOAD_JOURNAL': 'not json'})
+        self.assertEqual(env.get_journal_entry('/m/a/1', dict()), None)
+
+class JournalUnloadTest(unittest.TestCase):
+    """
+    Class to test unloading modules with a malformed journal entry.
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.modfile = os.path.join(self.root, 'a', '1')
+        os.makedirs(os.path.dirname(self.modfile))
+        with open(self.modfile, 'w') as f:
+            f.write('set A_VERSION 1\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def run_modm(self, args, environ):
+        stream = Buffer()
+        Modm(['modm.py'] + args, environ=environ).run(stream)
+        return stream.text
+
+    def test_unload(self):
+        for entry in [[['bogus', 'X']], [[]]]:
+            environ = {'MODM_MODULES_PATH': self.root,
+                       'MODM_LOADED_MODULES': self.modfile,
+                       'MODM_LOAD_JOURNAL': json.dumps({self.modfile: entry}),
+                       'MODM_USE_CACHE': 'off',
+                       'A_VERSION': '1'}
+            output = self.run_modm(['unload', 'a'], environ)
+            self.assertTrue("unset A_VERSION" in output, output)
+            self.assertTrue("export MODM_LOADED_MODULES=''" in output or
+                            'unset MODM_LOADED_MODULES' in output, output)
+
+if __name__ == '__main__':
+    unittest.main()